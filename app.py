@@ -1,8 +1,19 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, redirect, render_template, request, jsonify
 from dotenv import load_dotenv
+from flask_sock import Sock
 import os
+import json
 import logging
-from coupon_chatbot import CouponChatbot
+import threading
+import requests
+from coupon_chatbot import CouponChatbot, COUPON_PATTERNS, answer_cacheable, begin_answer, intent_bundle
+from bulk_coupons import BulkCouponGenerator
+from chat_socket import CLOSE_AT_CAPACITY, ChatSocketSession
+from http_cache import CachedBody, StaticAssets, IMMUTABLE
+from profiling import RequestProfiler, PROFILE_HEADER, PROFILE_MODE_HEADER
+from scheduler import AdmissionController
+from cluster import Cluster, FORWARDED_HEADER, SESSION_COOKIE, SESSION_HEADER
+import profiling
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +27,29 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+sock = Sock(app)
+
+# Serve static files under fingerprinted, precompressed URLs
+assets = StaticAssets(app)
+
+# The greeting never changes while the app runs, so build its response once
+greeting_body = CachedBody(
+    json.dumps({'greeting': "Namaste! I'm JUGAAD, your personal shopping assistant. I'm here to help you save money with the best deals and coupons. What would you like to shop for today? 🎉"}).encode('utf-8'),
+    'application/json'
+)
+
+# Canned intents the browser answers locally, versioned by content
+intents = intent_bundle()
+intents_body = CachedBody(json.dumps(intents).encode('utf-8'), 'application/json')
+
+# Initialize request profiler
+profiler = RequestProfiler.from_env()
+
+# Initialize admission control for LLM-bound work
+admission = AdmissionController.from_env()
+
+# Route each session to the node that owns it when running several nodes
+cluster = Cluster.from_env()
 
 # Initialize chatbot
 chatbot = None
@@ -25,9 +59,12 @@ def get_chatbot():
     if chatbot is None:
         try:
             api_key = os.getenv('GOOGLE_API_KEY')
-            if not api_key:
+            if os.getenv('LLM_BACKEND', 'gemini') == 'local':
+                logger.info("Using local stand-in models")
+            elif not api_key:
                 raise ValueError("GOOGLE_API_KEY not found in environment variables")
-            logger.debug(f"API Key found: {api_key[:5]}...")  # Log first 5 chars of API key
+            else:
+                logger.debug(f"API Key found: {api_key[:5]}...")  # Log first 5 chars of API key
             chatbot = CouponChatbot(api_key)
             logger.info("Chatbot initialized successfully")
         except Exception as e:
@@ -35,35 +72,266 @@ def get_chatbot():
             raise
     return chatbot
 
+def answer(message):
+    """Classify a message and answer it, queueing LLM-bound work behind the admission controller"""
+    chatbot = get_chatbot()
+    begin_answer()
+    try:
+        with profiling.span('routing'):
+            route = chatbot.classify(message)
+    except Exception as e:
+        logger.error(f"Error routing message: {str(e)}", exc_info=True)
+        return chatbot.error_response(e)
+
+    if not route.llm_bound:
+        admission.record_fast_path()
+        return chatbot.get_response(message, route)
+
+    with admission.slot(route.priority) as admitted:
+        if not admitted:
+            return chatbot.degraded_response(route, message)
+        return chatbot.get_response(message, route)
+
+# Each open socket holds a server thread; keep some free for plain HTTP requests
+WS_MAX_SOCKETS = int(os.getenv('WS_MAX_SOCKETS', '16'))
+socket_slots = threading.BoundedSemaphore(WS_MAX_SOCKETS)
+
+# Largest batch /api/coupons/bulk will stream in one request
+BULK_MAX_CARDS = int(os.getenv('BULK_MAX_CARDS', '100000'))
+
+def answer_stream(message, cancelled):
+    """Streaming form of answer(), stopping early once cancelled is set"""
+    chatbot = get_chatbot()
+    begin_answer()
+    try:
+        route = chatbot.classify(message)
+    except Exception as e:
+        logger.error(f"Error routing message: {str(e)}", exc_info=True)
+        yield chatbot.error_response(e)
+        return
+
+    if not route.llm_bound:
+        admission.record_fast_path()
+        yield chatbot.get_response(message, route)
+        return
+
+    with admission.slot(route.priority) as admitted:
+        # Superseded while queued; don't spend Gemini calls on it
+        if cancelled.is_set():
+            return
+        if not admitted:
+            yield chatbot.degraded_response(route, message)
+            return
+        yield from chatbot.stream_response(message, route, cancelled)
+
+def is_admin_request():
+    return profiler.is_admin(request.headers.get('X-Admin-Token'))
+
+def session_id():
+    return request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE) or request.args.get('session')
+
+def route_to_owner():
+    """Forward or redirect a request whose session another node owns; None means serve it here"""
+    if request.headers.get(FORWARDED_HEADER):
+        cluster.count('received')
+        return None
+    owner = cluster.owner(session_id())
+    if owner is None:
+        if cluster.enabled:
+            cluster.count('local')
+        return None
+
+    path = request.full_path.rstrip('?')
+    if cluster.routing == 'redirect':
+        cluster.count('redirected')
+        return redirect(cluster.url(owner, path), 307)
+
+    headers = {name: request.headers[name]
+               for name in ('Content-Type', 'X-Admin-Token', PROFILE_HEADER, PROFILE_MODE_HEADER)
+               if name in request.headers}
+    headers[SESSION_HEADER] = session_id()
+    try:
+        forwarded = cluster.forward(owner, request.method, path, request.get_data(), headers)
+    except requests.RequestException as e:
+        # Serving here loses the session's state but keeps the user answered
+        logger.error(f"Error forwarding to {owner}: {str(e)}")
+        cluster.count('forward_errors')
+        return None
+
+    resp = Response(forwarded.content, status=forwarded.status_code,
+                    content_type=forwarded.headers.get('Content-Type'))
+    for name in ('X-Jugaad-Trace-Id', 'X-Jugaad-Node'):
+        if name in forwarded.headers:
+            resp.headers[name] = forwarded.headers[name]
+    return resp
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', intents_url=f"/api/intents?v={intents['version']}")
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    routed = route_to_owner()
+    if routed is not None:
+        return routed
+
     try:
         data = request.get_json()
         if not data or 'message' not in data:
             return jsonify({'error': 'No message provided'}), 400
 
         message = data['message']
-        logger.debug(f"Received message: {message}")
-        chatbot = get_chatbot()
-        response = chatbot.get_response(message)
-        logger.debug(f"Generated response: {response}")
+        with profiler.trace_request(request.path,
+                                    request.headers.get(PROFILE_HEADER),
+                                    request.headers.get(PROFILE_MODE_HEADER)) as trace:
+            logger.debug(f"Received message: {message}")
+            response = answer(message)
+            logger.debug(f"Generated response: {response}")
+        
+        if cluster.enabled and session_id():
+            cluster.sessions.record(session_id(), message, response)
         
-        return jsonify({'response': response})
+        resp = jsonify({'response': response, 'cacheable': answer_cacheable()})
+        resp.headers['X-Jugaad-Trace-Id'] = trace.id
+        resp.headers['X-Jugaad-Node'] = cluster.node_id
+        return resp
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}", exc_info=True)
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/session')
+def session_state():
+    routed = route_to_owner()
+    if routed is not None:
+        return routed
+
+    sid = session_id()
+    if not sid:
+        return jsonify({'error': 'No session id provided'}), 400
+    state = cluster.sessions.get(sid) or {'turns': []}
+    return jsonify({'session_id': sid, 'node': cluster.node_id, 'turns': state['turns']})
+
+@sock.route('/ws/chat')
+def chat_socket(ws):
+    sid = session_id()
+    owner = cluster.owner(sid)
+    if owner is not None:
+        # A socket can't be proxied like a request; send the client to the owner
+        cluster.count('redirected')
+        url = cluster.url(owner, f"/ws/chat?session={sid}")
+        ws.send(json.dumps({'type': 'redirect', 'url': 'ws' + url[len('http'):]}))
+        return
+
+    def session_answer_stream(message, cancelled):
+        chunks = []
+        for chunk in answer_stream(message, cancelled):
+            chunks.append(chunk)
+            yield chunk
+        if cluster.enabled and sid and not cancelled.is_set():
+            cluster.sessions.record(sid, message, ''.join(chunks).strip())
+
+    if not socket_slots.acquire(blocking=False):
+        # The page keeps using HTTP and backs off before retrying the socket
+        logger.warning(f"Refusing WebSocket: {WS_MAX_SOCKETS} already open")
+        ws.close(reason=CLOSE_AT_CAPACITY, message='Too many open sockets')
+        return
+    try:
+        session = ChatSocketSession(
+            ws, session_answer_stream, is_cacheable=answer_cacheable,
+            heartbeat_interval=float(os.getenv('WS_HEARTBEAT_INTERVAL', '20')),
+            idle_timeout=float(os.getenv('WS_IDLE_TIMEOUT', '60'))
+        )
+        session.run()
+    finally:
+        socket_slots.release()
+
 @app.route('/api/greeting')
 def greeting():
     try:
-        return jsonify({'greeting': "Namaste! I'm JUGAAD, your personal shopping assistant. I'm here to help you save money with the best deals and coupons. What would you like to shop for today? 🎉"})
+        return greeting_body.response('public, max-age=3600')
     except Exception as e:
         logger.error(f"Error in greeting endpoint: {str(e)}", exc_info=True)
         return jsonify({'greeting': "Namaste! I'm JUGAAD, your personal shopping assistant. How can I help you save money today? 🎉"})
 
+@app.route('/api/intents')
+def intent_bundle_endpoint():
+    # A URL carrying the current version never changes; the bare URL is revalidated
+    if request.args.get('v') == intents['version']:
+        return intents_body.response(IMMUTABLE)
+    return intents_body.response('public, max-age=300')
+
+@app.route('/api/coupons/bulk')
+def bulk_coupons():
+    platform = request.args.get('platform', 'default').lower()
+    if platform not in COUPON_PATTERNS:
+        return jsonify({'error': f'Unknown platform: {platform}'}), 400
+    try:
+        n = int(request.args.get('n', '100'))
+        seed = request.args.get('seed')
+        seed = int(seed) if seed is not None else None
+    except ValueError:
+        return jsonify({'error': 'n and seed must be integers'}), 400
+    if not 0 < n <= BULK_MAX_CARDS:
+        return jsonify({'error': f'n must be between 1 and {BULK_MAX_CARDS}'}), 400
+    if seed is not None and seed < 0:
+        return jsonify({'error': 'seed must not be negative'}), 400
+
+    generator = BulkCouponGenerator(platform, seed=seed)
+    return Response(generator.iter_ndjson(n), mimetype='application/x-ndjson')
+
+@app.route('/api/admin/traces')
+def admin_traces():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'traces': profiler.slowest()})
+
+@app.route('/api/admin/cache')
+def admin_cache():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(get_chatbot().response_cache.stats())
+
+@app.route('/api/admin/scheduler')
+def admin_scheduler():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(admission.stats())
+
+@app.route('/api/admin/hedging')
+def admin_hedging():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(get_chatbot().hedger.stats())
+
+@app.route('/api/admin/cluster')
+def admin_cluster():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(cluster.stats())
+
+@app.route('/api/admin/cluster/members', methods=['POST'])
+def admin_cluster_members():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json()
+    if not data or not isinstance(data.get('nodes'), dict):
+        return jsonify({'error': 'No nodes provided'}), 400
+    return jsonify(cluster.set_members(data['nodes']))
+
+@app.route('/api/cluster/sessions', methods=['POST'])
+def cluster_sessions():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json()
+    if not data or not isinstance(data.get('sessions'), dict):
+        return jsonify({'error': 'No sessions provided'}), 400
+    return jsonify({'taken_over': cluster.take_over(data['sessions'])})
+
+@app.route('/api/admin/models')
+def admin_models():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(get_chatbot().router.stats())
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,106 @@
+import argparse
+import json
+import sys
+from typing import Iterator, Optional
+
+import numpy as np
+
+from coupon_chatbot import (
+    COUPON_PATTERNS,
+    DISCOUNT_AMOUNTS,
+    CATEGORY_DISCOUNTS,
+    EXPIRY_DATES,
+    fallback_tip,
+    generate_details
+)
+
+# Cards generated per NumPy batch; part of what a seed reproduces
+CHUNK_SIZE = 4096
+
+
+def _json(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class BulkCouponGenerator:
+    """
+    Generates sample deal cards in bulk as NDJSON.
+
+    Random choices are drawn as NumPy index arrays and every string that
+    doesn't depend on the coupon number is formatted once up front, so a
+    card costs a couple of array lookups and string concatenations. The
+    same platform, seed and count always produce the same output.
+    """
+
+    def __init__(self, platform: str = "default", seed: Optional[int] = None, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+            platform: The platform name (amazon, flipkart, etc.)
+            seed: Seed for reproducible output; None draws fresh entropy
+            chunk_size: Cards generated per batch
+        """
+        self.platform = platform.lower()
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+
+        # Every pattern is a fixed prefix followed by {num}
+        patterns = COUPON_PATTERNS.get(self.platform, COUPON_PATTERNS["default"])
+        self._prefixes = np.array([pattern.replace("{num}", "") for pattern in patterns], dtype=object)
+
+        discounts = CATEGORY_DISCOUNTS.get(self.platform, DISCOUNT_AMOUNTS)
+        self._discounts = np.array(
+            [f', "discount": {_json(d)}, "details": {_json(generate_details(self.platform, d))}' for d in discounts],
+            dtype=object)
+        self._expiry_dates = np.array([f', "valid_till": {_json(d)}' for d in EXPIRY_DATES], dtype=object)
+        self._tail = f', "store": {_json(self.platform.capitalize())}, "tip": {_json(fallback_tip(self.platform))}}}'
+
+    def _batch(self, n: int) -> str:
+        pattern_idx = self.rng.integers(0, len(self._prefixes), n)
+        # Same range as generate_coupon_code: 3-5 digits
+        nums = self.rng.integers(100, 100000, n).astype(str).astype(object)
+        discount_idx = self.rng.integers(0, len(self._discounts), n)
+        expiry_idx = self.rng.integers(0, len(self._expiry_dates), n)
+
+        lines = ('{"code": "' + self._prefixes[pattern_idx] + nums + '"'
+                 + self._discounts[discount_idx] + self._expiry_dates[expiry_idx] + self._tail)
+        return "\n".join(lines) + "\n"
+
+    def iter_ndjson(self, n: int) -> Iterator[str]:
+        """
+        Stream n deal cards as NDJSON, one batch of lines at a time
+        Args:
+            n: Number of cards to generate
+        Yields:
+            str: Newline-terminated JSON lines
+        """
+        remaining = n
+        while remaining > 0:
+            size = min(self.chunk_size, remaining)
+            yield self._batch(size)
+            remaining -= size
+
+
+def main():
+    """Write bulk deal cards as NDJSON to stdout or a file"""
+    parser = argparse.ArgumentParser(description="Generate sample deal cards as NDJSON")
+    parser.add_argument("platform", choices=sorted(COUPON_PATTERNS), help="Platform to generate cards for")
+    parser.add_argument("-n", type=int, default=1000, help="Number of cards (default: 1000)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible output")
+    parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    args = parser.parse_args()
+    if args.n <= 0:
+        parser.error("-n must be a positive number of cards")
+    if args.seed is not None and args.seed < 0:
+        parser.error("--seed must not be negative")
+
+    generator = BulkCouponGenerator(args.platform, seed=args.seed)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for chunk in generator.iter_ndjson(args.n):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
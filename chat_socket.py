@@ -0,0 +1,152 @@
+import json
+import time
+import logging
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Close codes telling the page why its socket went away: back off and retry
+# when the server is full, stay on HTTP until the next message when idle
+CLOSE_AT_CAPACITY = 1013
+CLOSE_IDLE = 4000
+
+
+class ChatSocketSession:
+    """
+    Serves one chat session over a persistent WebSocket.
+
+    Client messages:
+        {"type": "message", "id": ..., "message": "..."}  ask something
+        {"type": "cancel", "id": ...}                     drop an in-flight answer
+        {"type": "ping"} / {"type": "pong"}               heartbeats
+
+    Server messages:
+        {"type": "chunk", "id": ..., "text": "..."}       part of an answer
+        {"type": "done", "id": ..., "response": "...",    the full answer, and whether
+         "cacheable": true}                               the client may reuse it
+        {"type": "cancelled", "id": ...}                  answer abandoned
+        {"type": "error", "id": ..., "error": "..."}
+        {"type": "ping"} / {"type": "pong"}
+        {"type": "redirect", "url": "..."}                sent by app.py instead of a session
+                                                          when another node owns it
+
+    The socket is closed with CLOSE_IDLE after idle_timeout seconds with no
+    message, cancel or answer in progress.
+
+    A new message cancels the answer still in flight, if any. Streamed
+    answers stop at the next chunk; an answer built in one piece (deal
+    cards, clarifications) finishes its Gemini calls on its own thread and
+    is then dropped. An answer whose stream fails part-way ends with an
+    error, never a done carrying the partial text.
+    """
+
+    def __init__(self, ws, answer_stream: Callable[[str, threading.Event], Iterator[str]],
+                 heartbeat_interval: float = 20, idle_timeout: float = 60,
+                 is_cacheable: Callable[[], bool] = lambda: True):
+        """
+        Args:
+            ws: The WebSocket connection
+            answer_stream: Function streaming answer chunks for a message until its event is set
+            heartbeat_interval: Seconds of silence before the server pings
+            idle_timeout: Seconds without a client message, cancel or running answer before the socket is closed
+            is_cacheable: Called on the answering thread once a stream ends; whether clients may reuse the answer
+        """
+        self.ws = ws
+        self.answer_stream = answer_stream
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.is_cacheable = is_cacheable
+        self._send_lock = threading.Lock()
+        self._current_id = None
+        self._current_cancel: Optional[threading.Event] = None
+        self._answer_thread: Optional[threading.Thread] = None
+        self._last_seen = time.monotonic()
+
+    def _send(self, payload: Dict) -> None:
+        with self._send_lock:
+            self.ws.send(json.dumps(payload))
+
+    def _cancel_current(self) -> None:
+        if self._current_cancel is not None:
+            self._current_cancel.set()
+            self._current_cancel = None
+
+    def _start(self, request_id, message: str) -> None:
+        self._cancel_current()
+        cancelled = threading.Event()
+        self._current_id = request_id
+        self._current_cancel = cancelled
+        self._answer_thread = threading.Thread(target=self._answer, args=(request_id, message, cancelled),
+                                               name='jugaad-ws-answer', daemon=True)
+        self._answer_thread.start()
+
+    def _answer(self, request_id, message: str, cancelled: threading.Event) -> None:
+        chunks = []
+        stream = self.answer_stream(message, cancelled)
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                chunks.append(chunk)
+                self._send({'type': 'chunk', 'id': request_id, 'text': chunk})
+            if cancelled.is_set():
+                self._send({'type': 'cancelled', 'id': request_id})
+            else:
+                self._send({'type': 'done', 'id': request_id, 'response': ''.join(chunks).strip(),
+                            'cacheable': self.is_cacheable()})
+        except Exception as e:
+            logger.error(f"Error answering over WebSocket: {str(e)}", exc_info=True)
+            try:
+                self._send({'type': 'error', 'id': request_id, 'error': 'Internal server error'})
+            except Exception:
+                pass
+        finally:
+            stream.close()
+            # The idle clock starts once the answer is out
+            self._last_seen = time.monotonic()
+
+    def _handle(self, raw: str) -> None:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            self._send({'type': 'error', 'id': None, 'error': 'Invalid JSON'})
+            return
+
+        kind = data.get('type')
+        if kind in ('message', 'cancel'):
+            # Heartbeats alone don't keep an idle tab's socket open
+            self._last_seen = time.monotonic()
+        if kind == 'message':
+            message = data.get('message')
+            if not isinstance(message, str) or not message.strip():
+                self._send({'type': 'error', 'id': data.get('id'), 'error': 'No message provided'})
+                return
+            self._start(data.get('id'), message)
+        elif kind == 'cancel':
+            if data.get('id') == self._current_id:
+                self._cancel_current()
+        elif kind == 'ping':
+            self._send({'type': 'pong'})
+        elif kind != 'pong':
+            self._send({'type': 'error', 'id': data.get('id'), 'error': f'Unknown message type: {kind}'})
+
+    def _idle(self) -> bool:
+        answering = self._answer_thread is not None and self._answer_thread.is_alive()
+        return not answering and time.monotonic() - self._last_seen > self.idle_timeout
+
+    def run(self) -> None:
+        """Serve the connection until the client leaves or goes idle"""
+        try:
+            while True:
+                raw = self.ws.receive(timeout=self.heartbeat_interval)
+                if raw is not None:
+                    self._handle(raw)
+                if self._idle():
+                    logger.info("Closing idle WebSocket")
+                    self.ws.close(reason=CLOSE_IDLE, message='Idle')
+                    break
+                if raw is None:
+                    self._send({'type': 'ping'})
+        finally:
+            self._cancel_current()
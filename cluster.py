@@ -0,0 +1,307 @@
+import os
+import time
+import bisect
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Marks a request already routed by a node, so it is never forwarded twice
+FORWARDED_HEADER = 'X-Jugaad-Forwarded'
+SESSION_HEADER = 'X-Session-Id'
+SESSION_COOKIE = 'jugaad_session'
+
+
+def parse_nodes(spec: str) -> Dict[str, str]:
+    """
+    Parse a cluster member list such as "a=http://10.0.0.1:5000,b=http://10.0.0.2:5000"
+    Args:
+        spec: Comma-separated node_id=base_url pairs
+    Returns:
+        Dict[str, str]: Base URL for each node id
+    """
+    nodes = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        node_id, _, url = item.partition('=')
+        nodes[node_id.strip()] = url.strip().rstrip('/')
+    return nodes
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes; adding or removing a node only
+    moves the keys that node gains or loses
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        """
+        Args:
+            nodes: Initial node ids
+            vnodes: Points each node gets on the ring
+        """
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def owner(self, key: str) -> Optional[str]:
+        """The node owning a key, or None on an empty ring"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class SessionStore:
+    """Recent turns per session, bounded by session count and idle time"""
+
+    def __init__(self, max_sessions: int = 2000, ttl: float = 1800, max_turns: int = 10):
+        """
+        Args:
+            max_sessions: Sessions kept before the least recently active is dropped
+            ttl: Seconds a session is kept after its last turn
+            max_turns: Turns kept per session
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._sessions: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state['updated'] < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    @classmethod
+    def from_env(cls) -> 'SessionStore':
+        """Build from CLUSTER_SESSION_MAX, CLUSTER_SESSION_TTL and CLUSTER_SESSION_TURNS"""
+        return cls(
+            max_sessions=int(os.getenv('CLUSTER_SESSION_MAX', '2000')),
+            ttl=float(os.getenv('CLUSTER_SESSION_TTL', '1800')),
+            max_turns=int(os.getenv('CLUSTER_SESSION_TURNS', '10'))
+        )
+
+    def record(self, session_id: str, message: str, response: str) -> None:
+        """Append a turn to a session"""
+        now = time.time()
+        with self._lock:
+            state = self._sessions.pop(session_id, None) or {'turns': []}
+            state['turns'] = (state['turns'] + [{'message': message, 'response': response, 'at': now}])[-self.max_turns:]
+            state['updated'] = now
+            self._sessions[session_id] = state
+            self._expire(now)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            state = self._sessions.get(session_id)
+            return dict(state) if state is not None else None
+
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            self._expire(time.time())
+            return list(self._sessions)
+
+    def pop(self, session_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Remove sessions and return their state, for handing off to another node"""
+        with self._lock:
+            return {sid: self._sessions.pop(sid) for sid in session_ids if sid in self._sessions}
+
+    def load(self, sessions: Dict[str, Dict]) -> None:
+        """Take over sessions handed off by another node, keeping whichever copy is newer"""
+        with self._lock:
+            for session_id, state in sessions.items():
+                current = self._sessions.get(session_id)
+                if current is None or current['updated'] < state['updated']:
+                    self._sessions[session_id] = state
+                    self._sessions.move_to_end(session_id)
+            self._expire(time.time())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class Cluster:
+    """
+    Session-affine routing across nodes. Each session id is owned by one
+    node on a consistent-hash ring; other nodes forward (or 307-redirect)
+    its requests to the owner, and hand session state over when the
+    membership changes.
+    """
+
+    def __init__(self, node_id: str = 'local', nodes: Optional[Dict[str, str]] = None,
+                 routing: str = 'forward', forward_timeout: float = 30, vnodes: int = 128,
+                 admin_token: Optional[str] = None, sessions: Optional[SessionStore] = None):
+        """
+        Args:
+            node_id: This node's id
+            nodes: Base URL for each member; clustering is off when empty
+            routing: "forward" to proxy requests to the owner, "redirect" to send a 307;
+                redirects to another origin fail in browsers, which would need CORS to follow them
+            forward_timeout: Seconds to wait for the owner when forwarding
+            vnodes: Ring points per node
+            admin_token: Token sent with session handoffs; required when nodes are given
+            sessions: Store for the sessions this node owns
+        """
+        if routing not in ('forward', 'redirect'):
+            raise ValueError(f"Unknown cluster routing: {routing}")
+        if nodes and not admin_token:
+            # Handoffs between nodes authenticate with it; without it they'd all be refused
+            raise ValueError("Multi-node mode needs ADMIN_TOKEN set on every node")
+        self.node_id = node_id
+        self.routing = routing
+        self.forward_timeout = forward_timeout
+        self.admin_token = admin_token
+        self.nodes = dict(nodes or {})
+        self.ring = HashRing(self.nodes, vnodes=vnodes)
+        if self.nodes and routing == 'redirect':
+            logger.warning("CLUSTER_ROUTING=redirect: browsers can't follow cross-origin redirects of chat requests;"
+                           " use forward unless all clients are API clients or nodes share an origin")
+        self.sessions = sessions or SessionStore()
+        self._http = requests.Session()
+        self._lock = threading.Lock()
+        self._counts = {'local': 0, 'forwarded': 0, 'redirected': 0, 'received': 0, 'forward_errors': 0,
+                        'handed_off': 0, 'taken_over': 0}
+
+    @classmethod
+    def from_env(cls) -> 'Cluster':
+        """Build from NODE_ID, CLUSTER_NODES, CLUSTER_ROUTING, CLUSTER_FORWARD_TIMEOUT and the CLUSTER_SESSION_* limits"""
+        return cls(
+            node_id=os.getenv('NODE_ID', 'local'),
+            nodes=parse_nodes(os.getenv('CLUSTER_NODES', '')),
+            routing=os.getenv('CLUSTER_ROUTING', 'forward'),
+            forward_timeout=float(os.getenv('CLUSTER_FORWARD_TIMEOUT', '30')),
+            admin_token=os.getenv('ADMIN_TOKEN'),
+            sessions=SessionStore.from_env()
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.nodes)
+
+    def count(self, outcome: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[outcome] += n
+
+    def owner(self, session_id: Optional[str]) -> Optional[str]:
+        """
+        The node that should serve a session
+        Args:
+            session_id: The session id, if the client sent one
+        Returns:
+            The owning node id, or None if this node should serve it
+        """
+        if not self.enabled or not session_id:
+            return None
+        with self._lock:
+            owner = self.ring.owner(session_id)
+        return None if owner == self.node_id else owner
+
+    def url(self, node_id: str, path: str) -> str:
+        return f"{self.nodes[node_id]}{path}"
+
+    def forward(self, node_id: str, method: str, path: str, body: bytes,
+                headers: Dict[str, str]) -> requests.Response:
+        """
+        Send a request on to the node owning its session
+        Args:
+            node_id: The owning node
+            method: HTTP method
+            path: Request path and query string
+            body: Raw request body
+            headers: Headers to pass along
+        Returns:
+            requests.Response: The owner's response
+        """
+        response = self._http.request(method, self.url(node_id, path), data=body,
+                                   headers={**headers, FORWARDED_HEADER: self.node_id},
+                                   timeout=self.forward_timeout)
+        self.count('forwarded')
+        return response
+
+    def set_members(self, nodes: Dict[str, str]) -> Dict:
+        """
+        Replace the member list and hand sessions this node no longer owns
+        to their new owners
+        Args:
+            nodes: Base URL for each member
+        Returns:
+            Dict: Sessions handed off and failed per node
+        """
+        with self._lock:
+            self.nodes = dict(nodes)
+            self.ring = HashRing(self.nodes, vnodes=self.ring.vnodes)
+        logger.info(f"Cluster members now {sorted(self.nodes)}")
+
+        moving: Dict[str, List[str]] = {}
+        for session_id in self.sessions.session_ids():
+            owner = self.owner(session_id)
+            if owner is not None:
+                moving.setdefault(owner, []).append(session_id)
+
+        result = {'handed_off': {}, 'failed': {}}
+        for owner, session_ids in moving.items():
+            sessions = self.sessions.pop(session_ids)
+            try:
+                response = self._http.post(self.url(owner, '/api/cluster/sessions'),
+                                           json={'sessions': sessions},
+                                           headers={'X-Admin-Token': self.admin_token or '', FORWARDED_HEADER: self.node_id},
+                                           timeout=self.forward_timeout)
+                response.raise_for_status()
+                result['handed_off'][owner] = len(sessions)
+                self.count('handed_off', len(sessions))
+            except Exception as e:
+                # Keep the sessions; the owner gets them on the next membership update
+                logger.error(f"Error handing sessions to {owner}: {str(e)}")
+                self.sessions.load(sessions)
+                result['failed'][owner] = len(sessions)
+        return result
+
+    def take_over(self, sessions: Dict[str, Dict]) -> int:
+        """Store sessions handed off by another node"""
+        self.sessions.load(sessions)
+        self.count('taken_over', len(sessions))
+        return len(sessions)
+
+    def stats(self) -> Dict:
+        """Return membership, routing counts and how many sessions this node holds"""
+        with self._lock:
+            return {
+                'node_id': self.node_id,
+                'enabled': self.enabled,
+                'routing': self.routing,
+                'members': dict(self.nodes),
+                'sessions': len(self.sessions),
+                **self._counts
+            }
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from scheduler import percentile
+
+ADMIN_TOKEN = 'harness'
+
+RELATIONS = ["sister", "brother", "mom", "dad", "best friend", "colleague", "cousin", "grandpa"]
+HOBBIES = ["cricket", "chess", "gardening", "painting", "yoga", "photography", "cycling", "running"]
+
+# Rephrasings of one question; a session keeps asking its own question in different words
+QUESTION_TEMPLATES = [
+    "what should i gift my {relation} who loves {hobby}",
+    "What should I gift my {relation} who loves {hobby}?",
+    "what should i gift my {relation} who really loves {hobby}",
+    "gift ideas for my {relation} who loves {hobby}",
+    "any gift ideas for my {relation} who loves {hobby}?"
+]
+
+
+def session_questions(rng: random.Random, turns: int) -> List[str]:
+    relation, hobby = rng.choice(RELATIONS), rng.choice(HOBBIES)
+    return [rng.choice(QUESTION_TEMPLATES).format(relation=relation, hobby=hobby) for _ in range(turns)]
+
+
+class LocalCluster:
+    """Runs n app processes on consecutive local ports with the local model backend"""
+
+    def __init__(self, n: int, base_port: int, affinity: bool, llm_latency: float):
+        self.urls = {f"node{i}": f"http://127.0.0.1:{base_port + i}" for i in range(n)}
+        self.affinity = affinity
+        self.llm_latency = llm_latency
+        self.processes: List[subprocess.Popen] = []
+
+    def _env(self, node_id: str) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            'NODE_ID': node_id,
+            'CLUSTER_NODES': ','.join(f"{node}={url}" for node, url in self.urls.items()) if self.affinity else '',
+            'LLM_BACKEND': 'local',
+            'ADMIN_TOKEN': ADMIN_TOKEN,
+            'LLM_RATE_LIMIT': '1000000',
+            'MODEL_TIERS': json.dumps({'full': {'local_latency': self.llm_latency},
+                                       'fast': {'local_latency': self.llm_latency / 4}})
+        })
+        env.setdefault('LLM_MAX_CONCURRENT', '16')
+        return env
+
+    def __enter__(self) -> 'LocalCluster':
+        app_dir = os.path.dirname(os.path.abspath(__file__))
+        for node_id, url in self.urls.items():
+            port = url.rsplit(':', 1)[1]
+            self.processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', port, '--no-reload', '--no-debugger'],
+                cwd=app_dir, env=self._env(node_id), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for url in self.urls.values():
+            self._wait_ready(url)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+    @staticmethod
+    def _wait_ready(url: str, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"{url}/api/greeting", timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError(f"Node at {url} didn't start")
+
+    def admin(self, url: str, path: str, payload: Dict = None) -> Dict:
+        headers = {'X-Admin-Token': ADMIN_TOKEN}
+        if payload is None:
+            return requests.get(f"{url}{path}", headers=headers, timeout=30).json()
+        return requests.post(f"{url}{path}", json=payload, headers=headers, timeout=30).json()
+
+
+def run_sessions(cluster: LocalCluster, sessions: int, turns: int, concurrency: int, seed: int) -> Dict:
+    """
+    Play every session's turns against randomly chosen nodes, as a
+    load balancer without affinity would
+    """
+    rng = random.Random(seed)
+    plans = [(str(uuid.UUID(int=rng.getrandbits(128))), session_questions(rng, turns)) for _ in range(sessions)]
+    urls = list(cluster.urls.values())
+
+    def play(plan):
+        session_id, questions = plan
+        pick = random.Random(session_id)
+        latencies = []
+        with requests.Session() as http:
+            for question in questions:
+                start = time.monotonic()
+                http.post(f"{pick.choice(urls)}/api/chat", json={'message': question},
+                          headers={'X-Session-Id': session_id}, timeout=60).raise_for_status()
+                latencies.append((time.monotonic() - start) * 1000)
+        return latencies
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [latency for result in pool.map(play, plans) for latency in result]
+    elapsed = time.monotonic() - start
+
+    caches = [cluster.admin(url, '/api/admin/cache') for url in urls]
+    hits = sum(cache['exact_hits'] + cache['near_hits'] for cache in caches)
+    lookups = hits + sum(cache['misses'] for cache in caches)
+    forwarded = sum(cluster.admin(url, '/api/admin/cluster')['forwarded'] for url in urls)
+    return {
+        'nodes': len(urls),
+        'affinity': cluster.affinity,
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'cache_hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+        'forwarded': forwarded,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'session_ids': [session_id for session_id, _ in plans]
+    }
+
+
+def check_handoff(cluster: LocalCluster, session_ids: List[str], turns: int) -> Dict:
+    """Remove the last node from the ring and check every session's turns are still served"""
+    leaving = list(cluster.urls)[-1]
+    remaining = {node: url for node, url in cluster.urls.items() if node != leaving}
+    moved = 0
+    for url in cluster.urls.values():
+        result = cluster.admin(url, '/api/admin/cluster/members', {'nodes': remaining})
+        moved += sum(result['handed_off'].values())
+
+    url = next(iter(remaining.values()))
+    complete = sum(
+        len(requests.get(f"{url}/api/session", headers={'X-Session-Id': session_id}, timeout=30).json()['turns']) == turns
+        for session_id in session_ids)
+    return {'left': leaving, 'sessions_moved': moved, 'sessions_complete': complete, 'sessions': len(session_ids)}
+
+
+def main():
+    """Report cache hit ratio and latency as a local cluster grows from 1 to N nodes"""
+    parser = argparse.ArgumentParser(description="Simulate a multi-node JUGAAD cluster on this machine")
+    parser.add_argument("-n", "--max-nodes", type=int, default=4, help="Largest cluster to run (default: 4)")
+    parser.add_argument("--sessions", type=int, default=40, help="Concurrent chat sessions (default: 40)")
+    parser.add_argument("--turns", type=int, default=8, help="Messages per session (default: 8)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Sessions played at once (default: 16)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Local model latency in seconds (default: 0.2)")
+    parser.add_argument("--base-port", type=int, default=5100, help="First node's port (default: 5100)")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the generated sessions")
+    parser.add_argument("--no-baseline", action="store_true", help="Skip the runs without session affinity")
+    args = parser.parse_args()
+
+    modes = [True] if args.no_baseline else [False, True]
+    print(f"{'nodes':>5} {'affinity':>8} {'requests':>8} {'rps':>7} {'hit ratio':>9} {'forwarded':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    handoff = None
+    for n in range(1, args.max_nodes + 1):
+        for affinity in modes:
+            with LocalCluster(n, args.base_port, affinity, args.llm_latency) as cluster:
+                result = run_sessions(cluster, args.sessions, args.turns, args.concurrency, args.seed)
+                print(f"{result['nodes']:>5} {'on' if affinity else 'off':>8} {result['requests']:>8} "
+                      f"{result['throughput_rps']:>7} {result['cache_hit_ratio']:>9} {result['forwarded']:>9} "
+                      f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}", flush=True)
+                if affinity and n == args.max_nodes and n > 1:
+                    handoff = check_handoff(cluster, result['session_ids'], args.turns)
+
+    if handoff is not None:
+        print(f"\nHandoff after {handoff['left']} left: {handoff['sessions_moved']} sessions moved, "
+              f"{handoff['sessions_complete']}/{handoff['sessions']} sessions kept every turn")
+
+if __name__ == "__main__":
+    main()
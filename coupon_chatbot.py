@@ -4,11 +4,17 @@ import google.generativeai as genai
 import logging
 import random
 import json
+import hashlib
 from datetime import datetime, timedelta
 import time
+import threading
 from functools import wraps
-from typing import List, Optional, Dict, Set
+from typing import Iterator, List, Optional, Dict, Set, NamedTuple
 import re
+import profiling
+from response_cache import ResponseCache
+from hedging import Hedger
+from model_router import ModelRouter
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +26,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Gemini calls allowed per minute; the local stand-in backend has no quota to respect
+LLM_RATE_LIMIT = int(os.getenv('LLM_RATE_LIMIT', '60'))
+
 def rate_limit(max_requests: int = 60, time_window: int = 60):
     """
     Rate limiting decorator
@@ -28,35 +37,382 @@ def rate_limit(max_requests: int = 60, time_window: int = 60):
         time_window: Time window in seconds
     """
     requests = []
+    lock = threading.Lock()
     
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            now = time.time()
-            # Remove requests older than the time window
-            requests[:] = [req for req in requests if now - req < time_window]
+            with lock:
+                now = time.time()
+                # Remove requests older than the time window
+                requests[:] = [req for req in requests if now - req < time_window]
+                
+                wait = 0
+                if len(requests) >= max_requests:
+                    wait = time_window - (now - requests[0])
+                    requests.pop(0)
+                
+                requests.append(now + wait)
             
-            if len(requests) >= max_requests:
+            if wait > 0:
                 logger.warning("Rate limit exceeded. Waiting before retrying...")
-                time.sleep(time_window - (now - requests[0]))
-                requests.pop(0)
-            
-            requests.append(now)
+                time.sleep(wait)
             return func(*args, **kwargs)
         return wrapper
     return decorator
 
+# One window for every Gemini call, whether plain, streamed or a hedge
+gemini_rate_limit = rate_limit(max_requests=LLM_RATE_LIMIT, time_window=60)
+
+# Define coupon code patterns for different platforms
+COUPON_PATTERNS = {
+    "amazon": ["SAVE{num}", "DEAL{num}", "OFF{num}", "FLASH{num}", "PRIME{num}"],
+    "flipkart": ["FLIP{num}", "BIG{num}", "SAVE{num}", "DEAL{num}", "OFF{num}"],
+    "myntra": ["MYNTRA{num}", "FASHION{num}", "STYLE{num}", "TREND{num}"],
+    "zomato": ["ZO{num}", "FOOD{num}", "EAT{num}", "SAVE{num}", "DEAL{num}"],
+    "swiggy": ["SWIGGY{num}", "FOOD{num}", "EAT{num}", "SAVE{num}", "DEAL{num}"],
+    "ajio": ["AJIO{num}", "FASHION{num}", "STYLE{num}", "TREND{num}"],
+    "meesho": ["MEE{num}", "SHOP{num}", "SAVE{num}", "DEAL{num}"],
+    "nykaa": ["NYK{num}", "BEAUTY{num}", "GLAM{num}", "STYLE{num}"],
+    "bigbasket": ["BB{num}", "GROCERY{num}", "SAVE{num}", "DEAL{num}"],
+    "grofers": ["GROF{num}", "GROCERY{num}", "SAVE{num}", "DEAL{num}"],
+    "blinkit": ["BLINK{num}", "GROCERY{num}", "SAVE{num}", "DEAL{num}"],
+    "dunzo": ["DUNZO{num}", "DELIVERY{num}", "SAVE{num}", "DEAL{num}"],
+    "puma": ["PUMA{num}", "SPORT{num}", "RUN{num}", "STYLE{num}", "FIT{num}"],
+    "nike": ["NIKE{num}", "JUST{num}", "SPORT{num}", "RUN{num}"],
+    "adidas": ["ADI{num}", "SPORT{num}", "RUN{num}", "STYLE{num}"],
+    "reebok": ["RBK{num}", "SPORT{num}", "FIT{num}", "STYLE{num}"],
+    "food": ["FOOD{num}", "EAT{num}", "SAVE{num}", "DEAL{num}", "TASTE{num}"],
+    "fashion": ["FASHION{num}", "STYLE{num}", "TREND{num}", "LOOK{num}", "SHOP{num}"],
+    "electronics": ["TECH{num}", "GADGET{num}", "DEAL{num}", "SAVE{num}", "OFF{num}"],
+    "baby": ["BABY{num}", "KIDS{num}", "SAVE{num}", "DEAL{num}", "HAPPY{num}"],
+    "default": ["SAVE{num}", "DEAL{num}", "OFF{num}", "FLASH{num}", "BEST{num}", "HAPPY{num}", "SPECIAL{num}"]
+}
+
+# Define more realistic discount amounts with specific price points in INR
+DISCOUNT_AMOUNTS = [
+    "10% off", "15% off", "20% off", "25% off", "30% off", 
+    "40% off", "50% off", "Flat ₹149 off", "Flat ₹249 off", "Flat ₹499 off",
+    "Flat ₹999 off", "Flat ₹1499 off", "Buy 1 Get 1 Free", "Extra 10% off on ₹1999",
+    "Flat ₹350 off on ₹2000+", "Flat ₹750 off on ₹3500+", "Extra 15% off up to ₹2000",
+    "Flat ₹500 off on ₹2500+", "Extra 20% off on footwear", "Flat ₹1000 off on ₹4999+"
+]
+
+# Define category-specific discount amounts
+CATEGORY_DISCOUNTS = {
+    "puma": ["20% off on all shoes", "Flat ₹750 off on ₹3500+", "Buy 1 Get 1 Free on selected shoes", 
+            "Flat ₹1500 off on running shoes", "40% off on selected styles", "Extra 15% off on ₹4999+"],
+    "nike": ["25% off on all shoes", "Flat ₹1000 off on ₹5000+", "Extra 10% off on Air Jordan", 
+            "Flat ₹2000 off on premium collection", "30% off on sports apparel"],
+    "adidas": ["30% off on all Originals", "Flat ₹1200 off on Ultra Boost", "Buy 1 Get 1 on selected items", 
+             "40% off on running shoes", "Extra 15% off on ₹3999+"],
+    "reebok": ["35% off on training shoes", "Flat ₹899 off on ₹2999+", "50% off on selected styles", 
+              "Buy 2 Get 1 Free on apparel", "Extra 10% off for first-time users"],
+    "electronics": ["Flat ₹2000 off on laptops", "Up to 40% off on smartphones", "Extra 10% off with bank cards", 
+                  "Flat ₹5000 off on purchases above ₹40000", "No-cost EMI on ₹15000+"],
+    "fashion": ["Buy 2 Get 1 Free", "Flat 40% off on ethnic wear", "Extra 15% off on ₹2499+", 
+              "Flat ₹750 off on ₹3000+", "Season sale: Up to 70% off"],
+    "food": ["Flat ₹150 off on orders above ₹499", "Buy 1 Get 1 on main course", "60% off up to ₹120", 
+           "Free delivery on orders above ₹199", "₹100 off on first 3 orders"]
+}
+
+# Expiry dates from April 12 onwards for the next 30 days, formatted once
+EXPIRY_DATES = tuple((datetime(2025, 4, 12) + timedelta(days=i)).strftime("%d %B %Y") for i in range(30))
+
+# Fallback tips with sarcasm if API fails
+FALLBACK_TIPS = {
+    "amazon": "Check for 'Lightning Deals' - they're like regular deals but with a fancy name to make you feel special!",
+    "flipkart": "Compare prices across platforms - because your wallet deserves the best, even if it means being a little disloyal!",
+    "myntra": "Wait for end-of-season sales - your patience will be rewarded with discounts that make your bank account smile!",
+    "zomato": "Order during off-peak hours - because saving money is worth eating dinner at 4 PM!",
+    "swiggy": "Check for restaurant-specific offers - sometimes the best deals are hiding in plain sight!",
+    "ajio": "Sign up for their newsletter - yes, more emails, but also more savings!",
+    "meesho": "Look for combo deals - because buying more to save more is totally logical!",
+    "nykaa": "Wait for their Pink Friday sale - it's like Black Friday but with a prettier name!",
+    "bigbasket": "Order in bulk during sales - your pantry will thank you, and so will your wallet!",
+    "grofers": "Check for first-order discounts - because being a new customer has its perks!",
+    "blinkit": "Look for time-specific offers - because shopping at odd hours is the new normal!",
+    "dunzo": "Compare delivery fees - sometimes the shortest route isn't the cheapest!",
+    "puma": "Check outlet stores online - because paying full price is so last season!",
+    "nike": "Wait for seasonal clearance - your patience will be rewarded with shoes that make you run faster (or at least look like you do)!",
+    "adidas": "Look for student discounts - because education should pay off in more ways than one!",
+    "reebok": "Check for bundle deals - because buying more to save more is the ultimate shopping hack!",
+    "food": "Order in groups - because sharing is caring, and splitting the bill is even better!",
+    "fashion": "Wait for end-of-season sales - your wardrobe will thank you, and so will your bank account!",
+    "electronics": "Compare prices across platforms - because your gadget deserves the best deal, even if it means being a little disloyal!",
+    "baby": "Buy in bulk during sales - because babies go through things faster than you can say 'diaper change'!"
+}
+
+def fallback_tip(platform: str) -> str:
+    """
+    Pick the canned shopping tip for a platform
+    Args:
+        platform: The platform name
+    Returns:
+        str: A shopping tip
+    """
+    # Return a platform-specific tip if available, otherwise a generic one
+    return FALLBACK_TIPS.get(platform.lower(), f"Check for seasonal sales and special promotions on {platform} to maximize your savings. Because who doesn't love a good deal? 😏")
+
+def generate_details(platform: str, discount: str) -> str:
+    """
+    Generate detailed description based on platform and discount
+    Args:
+        platform: The platform name
+        discount: The discount amount
+    Returns:
+        str: A detailed description
+    """
+    if platform.lower() in ["puma", "nike", "adidas", "reebok"]:
+        if "shoes" in discount.lower():
+            return f"Special offer on footwear! Use this code at checkout to get {discount}."
+        elif "apparel" in discount.lower():
+            return f"Exclusive clothing deal! Apply this code to receive {discount}."
+        elif "free" in discount.lower():
+            return f"Limited time offer! {discount} when you shop now."
+        else:
+            return f"Special savings on {platform.capitalize()} products! Use this code to get {discount}."
+    elif "free delivery" in discount.lower():
+        return f"No delivery charges! Use this code to get {discount}."
+    elif "emi" in discount.lower():
+        return f"Easy payment options! {discount} when you use this code."
+    else:
+        return f"Special offer for our valued customers! Use this code at checkout to get {discount}."
+
+# Define the phrases that select each fast-path (canned) intent
+INTENT_PATTERNS = {
+    "greeting": ["hi", "hello", "hey", "hola", "namaste", "greetings"],
+    "how_are_you": ["how are you", "how you doing", "how's it going", "how are things", "what's up", "how do you do", "how have you been"],
+    "thanks": ["thank you", "thanks", "thx", "thank u", "appreciate it", "grateful"],
+    "nice": ["you're nice", "you are nice", "you're good", "you are good", "you're helpful", "you are helpful", "you're amazing", "you are amazing"],
+    "time_greeting": ["good morning", "morning", "good afternoon", "good evening", "evening"],
+    "yes": ["yes", "yeah", "yep", "sure", "okay", "ok", "yup"],
+    "no": ["no", "nope", "nah", "not now", "not really"],
+    "identity": ["name", "who are you", "what are you", "your name", "introduce yourself", "tell me about yourself"],
+    "user_intro": [
+        r"my name is (\w+)",
+        r"i am (\w+)",
+        r"i'm (\w+)",
+        r"call me (\w+)"
+    ]
+}
+
+# Define the replies for each fast-path intent ({message} and {name} are filled in)
+CANNED_RESPONSES = {
+    "greeting": [
+        "Namaste! I'm JUGAAD, your personal shopping assistant. What deals can I find for you today? 🛍️",
+        "Hello there! JUGAAD at your service! Looking for some amazing deals today? 💰",
+        "Hi! I'm JUGAAD, ready to help you save money on your shopping. What are you looking to buy? 🎁",
+        "Hey! I'm here to find you the best deals. What can I help you with today? 🏷️",
+        "Namaste! JUGAAD here! What kind of shopping deals are you looking for? 💼",
+        "Oh, another shopper looking for deals! How original! 😏 Just kidding, I'm JUGAAD and I'm here to help! What are you shopping for today? 🛍️",
+        "Well, well, well... if it isn't another person looking to save money! I'm JUGAAD, and I'm here to make your shopping dreams come true! What are you looking for? 💰"
+    ],
+    "how_are_you": [
+        "I'm doing great, thanks for asking! Ready to help you find some amazing deals today. What are you shopping for? 😊",
+        "I'm fantastic! Always excited to help shoppers save money. What deals can I find for you? 🛍️",
+        "I'm wonderful! Thanks for checking in. Now, let's find you some incredible discounts - what are you looking for? 💰",
+        "Doing excellent and ready to hunt down the best deals for you! What kind of shopping are you interested in today? 🎁",
+        "I'm always in a great mood when I can help people save money! What shopping deals are you looking for? 🏷️",
+        "I'm just peachy! Living my best AI life, finding deals for humans like you. What are you shopping for today? 😏",
+        "Oh, you know, just being an awesome shopping assistant! I'm doing great, thanks for asking. Now, what deals can I find for you? 🛍️"
+    ],
+    "thanks": [
+        "You're very welcome! It's my pleasure to help. Anything else you'd like to find deals on today? 😊",
+        "Anytime! That's what JUGAAD is here for. Need help with any other shopping deals? 🛍️",
+        "Happy to help! Let me know if you need any other deals or discounts! 💰",
+        "My pleasure! Helping shoppers save money makes my day. Anything else you're looking for? 🎁",
+        "You're welcome! Feel free to ask about any other deals you might need! 🏷️",
+        "No need to thank me! I'm just doing my job of making your wallet happier. Need anything else? 😏",
+        "You're welcome! I live for these moments of helping people save money. What else can I find for you? 🛍️"
+    ],
+    "nice": [
+        "That's so kind of you to say! It makes my day to hear that. What kind of deals can I help you find today? 😊",
+        "Thank you for the kind words! I'm here to make your shopping experience better. What are you looking to buy? 🛍️",
+        "Aww, thanks! That means a lot to me. Now, let's find you some amazing deals! What are you shopping for? 💰",
+        "You just made my day! I'm always here to help you save money. What deals are you looking for? 🎁",
+        "Thank you! I really appreciate that. Let's find you some great deals - what are you interested in? 🏷️",
+        "Aww, you're making me blush! (Well, as much as an AI can blush anyway 😏) What deals can I find for you today? 🛍️",
+        "That's so sweet! I'm just doing my job, but I appreciate the compliment. What else can I help you find? 💰"
+    ],
+    "time_greeting": [
+        "{message}! It's always a good time to find amazing deals. What are you shopping for today? 😊",
+        "{message} to you too! Ready to help you find some great savings. What kind of deals are you looking for? 🛍️",
+        "{message}! Hope you're having a wonderful day. Let's find you some exciting offers - what are you interested in? 💰",
+        "{message}! Another day, another opportunity to save money. What are you shopping for? 🎁",
+        "{message}! I'm JUGAAD, and I'm here to make your shopping experience better. What deals can I find for you? 🏷️"
+    ],
+    "yes": [
+        "Great! What kind of deals or coupons are you looking for today? 😊",
+        "Excellent! Tell me what you're shopping for, and I'll find you the best deals! 🛍️",
+        "Perfect! What products or stores would you like coupons for? 💰",
+        "Wonderful! What are you looking to save money on today? 🎁",
+        "Awesome! What kind of shopping deals can I help you find? 🏷️",
+        "Fantastic! I was just waiting for someone to ask about deals today. What are you shopping for? 😏",
+        "Brilliant! Let's find you some amazing savings. What are you looking to buy? 🛍️"
+    ],
+    "no": [
+        "No problem! I'm here whenever you need to find great deals. Just let me know what you're looking for! 😊",
+        "That's okay! Feel free to ask when you're ready to find some amazing discounts. 🛍️",
+        "Sure thing! When you're ready to shop, I'll be here to help you save money. 💰",
+        "No worries! I'm here anytime you need help finding deals and coupons. 🎁",
+        "That's fine! Just let me know when you want to find some great shopping deals. 🏷️",
+        "Oh, you're one of those 'I don't need deals' people? I'll be here when you change your mind! 😏",
+        "No problem! I'm not going anywhere. Your wallet will thank me later when you're ready to save! 🛍️"
+    ],
+    "identity": [
+        "I'm JUGAAD! I'm your personal shopping assistant, always ready to help you find the best deals and save money! 🎉",
+        "My name is JUGAAD! I'm here to help you find amazing discounts and shopping deals! 💰",
+        "I'm JUGAAD, your AI shopping assistant focused on finding you the best deals and coupons! 🛍️",
+        "JUGAAD here! I help shoppers like you save money with great deals and discounts! 🏷️",
+        "I'm JUGAAD, your friendly neighborhood shopping assistant! I'm here to make your wallet happier! 🎁",
+        "The name's JUGAAD, shopping assistant extraordinaire! I'm here to find you the best deals in town! 💰",
+        "I'm JUGAAD, and I'm probably the only AI that gets excited about finding you discounts! 🛍️"
+    ],
+    "user_intro": [
+        "Nice to meet you, {name}! I'm JUGAAD, your personal shopping assistant. What kind of deals are you looking for today? 🛍️",
+        "Hello {name}! JUGAAD at your service! Can I help you find any special deals or discounts? 💰",
+        "Hi {name}! Great to meet you! What shopping deals can I find for you today? 🎁",
+        "Good to meet you, {name}! I'm JUGAAD, and I'm here to help you save money on your shopping! 💼",
+        "Hey {name}! I'm JUGAAD, and I'm excited to help you find some amazing deals! What are you shopping for? 🛍️",
+        "Welcome, {name}! I'm JUGAAD, and I'm here to make your shopping experience better. What deals can I find for you? 💰",
+        "Hello there, {name}! I'm JUGAAD, and I'm ready to help you save money. What are you looking to buy? 🎁"
+    ],
+    "offtopic": [
+        "As JUGAAD, I'm only designed to help with shopping deals and discounts. I don't have information about that topic. What kind of product deals are you looking for today? 🛍️",
+        "My expertise is strictly limited to shopping deals and discounts. I can't answer that question. Can I help you find a great deal instead? 💰",
+        "I'm JUGAAD, your shopping assistant. I don't have information about topics outside shopping and deals. I'd be happy to help you find discounts on products though! 🏷️",
+        "Sorry, that's outside my expertise. JUGAAD is only programmed to help with shopping deals and discounts. What are you looking to buy today? I can find you some great savings! 🎁",
+        "I'm JUGAAD - I focus exclusively on shopping deals. I don't have information about that topic. Let me help you save money on your next purchase instead! What are you shopping for? 💼",
+        "Oh, you're asking about something other than shopping? How refreshing! 😏 But I'm JUGAAD, and I'm here to help you save money. What are you shopping for today? 🛍️",
+        "Interesting question! But I'm just a shopping assistant, not a know-it-all AI. Let's focus on what I do best - finding you amazing deals. What are you shopping for? 💰"
+    ]
+}
+
+# Define how often each intent's reply ends with the tagline
+TAGLINE_RATES = {"greeting": 0.2, "identity": 0.3, "user_intro": 0.15, "offtopic": 0.1}
+
+# Fast-path intents in the order classify() checks them, and how each one's patterns match:
+#   word_prefix: the whole message, or its first word followed by a space
+#   contains: anywhere in the message
+#   contains_short: anywhere in a message of fewer than 5 words
+#   exact: the whole message
+#   regex: a regex search whose first group is the user's name
+INTENT_MATCHING = [
+    ("greeting", "word_prefix"),
+    ("how_are_you", "contains"),
+    ("thanks", "contains_short"),
+    ("nice", "contains"),
+    ("time_greeting", "exact"),
+    ("yes", "exact"),
+    ("no", "exact"),
+    ("identity", "contains"),
+    ("user_intro", "regex")
+]
+
+TAGLINE = " JUGAAD se hi to duniya chalti hai!"
+
+def match_canned_intent(user_message_lower: str) -> Optional["Route"]:
+    """
+    Find the first fast-path intent a lowercased message matches
+    Args:
+        user_message_lower: The lowercased user message
+    Returns:
+        Optional[Route]: The canned route, or None if no intent matches
+    """
+    for intent, match in INTENT_MATCHING:
+        patterns = INTENT_PATTERNS[intent]
+        if match == "word_prefix":
+            if user_message_lower.strip() in patterns or user_message_lower.startswith(tuple(p + " " for p in patterns)):
+                return Route(intent)
+        elif match == "contains":
+            if any(pattern in user_message_lower for pattern in patterns):
+                return Route(intent)
+        elif match == "contains_short":
+            if any(pattern in user_message_lower for pattern in patterns) and len(user_message_lower.split()) < 5:
+                return Route(intent)
+        elif match == "exact":
+            if user_message_lower in patterns:
+                return Route(intent)
+        elif match == "regex":
+            for pattern in patterns:
+                found = re.search(pattern, user_message_lower)
+                if found:
+                    return Route(intent, user_name=found.group(1).capitalize())
+    return None
+
+def intent_bundle() -> Dict:
+    """
+    Describe the fast-path intents for clients that answer them locally
+    Returns:
+        Dict: The intents in match order, with a version hash of their content
+    """
+    bundle = {
+        "tagline": TAGLINE,
+        "intents": [
+            {
+                "name": intent,
+                "match": match,
+                "patterns": INTENT_PATTERNS[intent],
+                "responses": CANNED_RESPONSES[intent],
+                "tagline_rate": TAGLINE_RATES.get(intent, 0)
+            }
+            for intent, match in INTENT_MATCHING
+        ]
+    }
+    bundle["version"] = hashlib.sha256(json.dumps(bundle, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return bundle
+
+# Gemini-backed intents and their scheduling priority (lower runs first)
+LLM_PRIORITIES = {"deal": 0, "clarification": 1, "fallback": 2}
+
+CLARIFICATION_FALLBACK = "Which store would you like a coupon for? I have deals for all major brands! (And yes, I'm actually excited to share them!) 🛍️"
+GENERAL_FALLBACK = "I'm JUGAAD, your shopping deals expert! How can I help you find great deals today? 🛍️"
+
+# Whether the answer being built on this thread may be kept by clients
+_answer_state = threading.local()
+
+def begin_answer() -> None:
+    """Start tracking cacheability for a new answer on this thread"""
+    _answer_state.cacheable = True
+
+def mark_uncacheable() -> None:
+    """Flag the current answer as one clients must not reuse (stand-ins, errors, deal cards)"""
+    _answer_state.cacheable = False
+
+def answer_cacheable() -> bool:
+    """Whether the answer built on this thread since begin_answer() may be cached"""
+    return getattr(_answer_state, 'cacheable', True)
+
+class Route(NamedTuple):
+    """How a message will be answered, decided before any LLM work"""
+    intent: str
+    platform: Optional[str] = None
+    coupon_code: Optional[str] = None
+    user_name: Optional[str] = None
+    cached_response: Optional[str] = None
+
+    @property
+    def llm_bound(self) -> bool:
+        """Whether answering this route calls Gemini"""
+        return self.intent in LLM_PRIORITIES and self.cached_response is None
+
+    @property
+    def priority(self) -> int:
+        """Scheduling priority for LLM-bound work"""
+        return LLM_PRIORITIES.get(self.intent, 0)
+
 class CouponChatbot:
     def __init__(self, api_key: str = None):
+        # Send each call site to its model tier (LLM_BACKEND=local runs offline)
+        self.router = ModelRouter.from_env()
+        
         # Configure Gemini
         self.api_key = api_key or os.getenv('GOOGLE_API_KEY')
-        if not self.api_key:
-            raise ValueError("Google API key not found in environment variables")
-            
-        genai.configure(api_key=self.api_key)
-        
-        # Create Gemini model
-        self.model = genai.GenerativeModel('models/gemini-2.0-flash')
+        if self.router.backend == 'gemini':
+            if not self.api_key:
+                raise ValueError("Google API key not found in environment variables")
+            genai.configure(api_key=self.api_key)
         
         # Define capabilities
         self.capabilities = [
@@ -98,60 +454,24 @@ class CouponChatbot:
             "baby": ["baby", "baby products", "kids", "children", "infant", "toddler"]
         }
         
-        # Define coupon code patterns for different platforms
-        self.coupon_patterns = {
-            "amazon": ["SAVE{num}", "DEAL{num}", "OFF{num}", "FLASH{num}", "PRIME{num}"],
-            "flipkart": ["FLIP{num}", "BIG{num}", "SAVE{num}", "DEAL{num}", "OFF{num}"],
-            "myntra": ["MYNTRA{num}", "FASHION{num}", "STYLE{num}", "TREND{num}"],
-            "zomato": ["ZO{num}", "FOOD{num}", "EAT{num}", "SAVE{num}", "DEAL{num}"],
-            "swiggy": ["SWIGGY{num}", "FOOD{num}", "EAT{num}", "SAVE{num}", "DEAL{num}"],
-            "ajio": ["AJIO{num}", "FASHION{num}", "STYLE{num}", "TREND{num}"],
-            "meesho": ["MEE{num}", "SHOP{num}", "SAVE{num}", "DEAL{num}"],
-            "nykaa": ["NYK{num}", "BEAUTY{num}", "GLAM{num}", "STYLE{num}"],
-            "bigbasket": ["BB{num}", "GROCERY{num}", "SAVE{num}", "DEAL{num}"],
-            "grofers": ["GROF{num}", "GROCERY{num}", "SAVE{num}", "DEAL{num}"],
-            "blinkit": ["BLINK{num}", "GROCERY{num}", "SAVE{num}", "DEAL{num}"],
-            "dunzo": ["DUNZO{num}", "DELIVERY{num}", "SAVE{num}", "DEAL{num}"],
-            "puma": ["PUMA{num}", "SPORT{num}", "RUN{num}", "STYLE{num}", "FIT{num}"],
-            "nike": ["NIKE{num}", "JUST{num}", "SPORT{num}", "RUN{num}"],
-            "adidas": ["ADI{num}", "SPORT{num}", "RUN{num}", "STYLE{num}"],
-            "reebok": ["RBK{num}", "SPORT{num}", "FIT{num}", "STYLE{num}"],
-            "food": ["FOOD{num}", "EAT{num}", "SAVE{num}", "DEAL{num}", "TASTE{num}"],
-            "fashion": ["FASHION{num}", "STYLE{num}", "TREND{num}", "LOOK{num}", "SHOP{num}"],
-            "electronics": ["TECH{num}", "GADGET{num}", "DEAL{num}", "SAVE{num}", "OFF{num}"],
-            "baby": ["BABY{num}", "KIDS{num}", "SAVE{num}", "DEAL{num}", "HAPPY{num}"],
-            "default": ["SAVE{num}", "DEAL{num}", "OFF{num}", "FLASH{num}", "BEST{num}", "HAPPY{num}", "SPECIAL{num}"]
-        }
+        # Deal card tables are shared with the bulk generator
+        self.coupon_patterns = COUPON_PATTERNS
+        self.discount_amounts = DISCOUNT_AMOUNTS
+        self.category_discounts = CATEGORY_DISCOUNTS
         
-        # Define more realistic discount amounts with specific price points in INR
-        self.discount_amounts = [
-            "10% off", "15% off", "20% off", "25% off", "30% off", 
-            "40% off", "50% off", "Flat ₹149 off", "Flat ₹249 off", "Flat ₹499 off",
-            "Flat ₹999 off", "Flat ₹1499 off", "Buy 1 Get 1 Free", "Extra 10% off on ₹1999",
-            "Flat ₹350 off on ₹2000+", "Flat ₹750 off on ₹3500+", "Extra 15% off up to ₹2000",
-            "Flat ₹500 off on ₹2500+", "Extra 20% off on footwear", "Flat ₹1000 off on ₹4999+"
-        ]
+        # Canned intent tables are shared with the browser's intent bundle
+        self.intent_patterns = INTENT_PATTERNS
+        self.canned_responses = CANNED_RESPONSES
+        self.tagline_rates = TAGLINE_RATES
         
-        # Define category-specific discount amounts
-        self.category_discounts = {
-            "puma": ["20% off on all shoes", "Flat ₹750 off on ₹3500+", "Buy 1 Get 1 Free on selected shoes", 
-                    "Flat ₹1500 off on running shoes", "40% off on selected styles", "Extra 15% off on ₹4999+"],
-            "nike": ["25% off on all shoes", "Flat ₹1000 off on ₹5000+", "Extra 10% off on Air Jordan", 
-                    "Flat ₹2000 off on premium collection", "30% off on sports apparel"],
-            "adidas": ["30% off on all Originals", "Flat ₹1200 off on Ultra Boost", "Buy 1 Get 1 on selected items", 
-                     "40% off on running shoes", "Extra 15% off on ₹3999+"],
-            "reebok": ["35% off on training shoes", "Flat ₹899 off on ₹2999+", "50% off on selected styles", 
-                      "Buy 2 Get 1 Free on apparel", "Extra 10% off for first-time users"],
-            "electronics": ["Flat ₹2000 off on laptops", "Up to 40% off on smartphones", "Extra 10% off with bank cards", 
-                          "Flat ₹5000 off on purchases above ₹40000", "No-cost EMI on ₹15000+"],
-            "fashion": ["Buy 2 Get 1 Free", "Flat 40% off on ethnic wear", "Extra 15% off on ₹2499+", 
-                      "Flat ₹750 off on ₹3000+", "Season sale: Up to 70% off"],
-            "food": ["Flat ₹150 off on orders above ₹499", "Buy 1 Get 1 on main course", "60% off up to ₹120", 
-                   "Free delivery on orders above ₹199", "₹100 off on first 3 orders"]
-        }
+        # Cache general fallback answers, matching near-duplicate messages too
+        self.response_cache = ResponseCache.from_env()
+        
+        # Duplicate slow calls at the sites listed in HEDGE_SITES
+        self.hedger = Hedger.from_env()
         
         # Start a chat with context
-        self.chat = self.model.start_chat(history=[])
+        self.chat = self.router.start_chat()
         self._set_context()
     
     def _set_context(self) -> None:
@@ -210,6 +530,44 @@ Remember:
             logger.error(f"Error setting context: {str(e)}")
             raise
     
+    @gemini_rate_limit
+    def _call_model(self, site: str, prompt: str) -> str:
+        return self.router.generate(site, prompt)
+    
+    @gemini_rate_limit
+    def _stream_model(self, site: str, prompt: str, cancelled: threading.Event) -> Iterator[str]:
+        return self.router.stream(site, prompt, cancelled)
+    
+    def _generate(self, site: str, prompt: str) -> str:
+        """
+        Run a single rate-limited Gemini call on the site's model tier, timed as a profiling span
+        Args:
+            site: The call site name (tip, intro, clarification, alternatives, fallback)
+            prompt: The prompt to send
+        Returns:
+            str: The stripped response text
+        """
+        with profiling.span(f'generate_content:{site}'):
+            if self.hedger.enabled(site):
+                # Streamed so the losing call can be abandoned part way through
+                return self.hedger.call(
+                    site, lambda cancelled: ''.join(self._stream_model(site, prompt, cancelled)).strip())
+            return self._call_model(site, prompt)
+    
+    def _generate_stream(self, site: str, prompt: str, cancelled: threading.Event) -> Iterator[str]:
+        """
+        Stream a rate-limited Gemini generate_content call chunk by chunk,
+        hedging the wait for the first chunk if the site is hedged
+        Args:
+            site: The call site name
+            prompt: The prompt to send
+            cancelled: Set to stop reading the stream early
+        Yields:
+            str: Response text chunks
+        """
+        yield from self.hedger.stream(
+            site, lambda attempt_cancelled: self._stream_model(site, prompt, attempt_cancelled), cancelled)
+    
     def generate_coupon_code(self, platform: str = "default") -> str:
         """
         Generate a realistic coupon code for the given platform
@@ -247,14 +605,7 @@ Remember:
         Returns:
             str: An expiry date
         """
-        # Create dates from April 12 onwards for the next 30 days
-        start_date = datetime(2025, 4, 12)  # Starting from April 12
-        expiry_dates = []
-        for i in range(30):
-            date = start_date + timedelta(days=i)
-            expiry_dates.append(date.strftime("%d %B %Y"))
-        
-        return random.choice(expiry_dates)
+        return random.choice(EXPIRY_DATES)
     
     def generate_shopping_tip(self, platform: str) -> str:
         """
@@ -267,37 +618,20 @@ Remember:
         # Use Gemini to generate a shopping tip
         try:
             prompt = f"Generate a short, helpful shopping tip for {platform} with a touch of playful sarcasm. The tip should be specific to {platform} and help users save money. Keep it under 50 words and make it witty."
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate('tip', prompt)
         except Exception as e:
             logger.error(f"Error generating shopping tip: {str(e)}")
-            
-            # Fallback tips with sarcasm if API fails
-            fallback_tips = {
-                "amazon": "Check for 'Lightning Deals' - they're like regular deals but with a fancy name to make you feel special!",
-                "flipkart": "Compare prices across platforms - because your wallet deserves the best, even if it means being a little disloyal!",
-                "myntra": "Wait for end-of-season sales - your patience will be rewarded with discounts that make your bank account smile!",
-                "zomato": "Order during off-peak hours - because saving money is worth eating dinner at 4 PM!",
-                "swiggy": "Check for restaurant-specific offers - sometimes the best deals are hiding in plain sight!",
-                "ajio": "Sign up for their newsletter - yes, more emails, but also more savings!",
-                "meesho": "Look for combo deals - because buying more to save more is totally logical!",
-                "nykaa": "Wait for their Pink Friday sale - it's like Black Friday but with a prettier name!",
-                "bigbasket": "Order in bulk during sales - your pantry will thank you, and so will your wallet!",
-                "grofers": "Check for first-order discounts - because being a new customer has its perks!",
-                "blinkit": "Look for time-specific offers - because shopping at odd hours is the new normal!",
-                "dunzo": "Compare delivery fees - sometimes the shortest route isn't the cheapest!",
-                "puma": "Check outlet stores online - because paying full price is so last season!",
-                "nike": "Wait for seasonal clearance - your patience will be rewarded with shoes that make you run faster (or at least look like you do)!",
-                "adidas": "Look for student discounts - because education should pay off in more ways than one!",
-                "reebok": "Check for bundle deals - because buying more to save more is the ultimate shopping hack!",
-                "food": "Order in groups - because sharing is caring, and splitting the bill is even better!",
-                "fashion": "Wait for end-of-season sales - your wardrobe will thank you, and so will your bank account!",
-                "electronics": "Compare prices across platforms - because your gadget deserves the best deal, even if it means being a little disloyal!",
-                "baby": "Buy in bulk during sales - because babies go through things faster than you can say 'diaper change'!"
-            }
-            
-            # Return a platform-specific tip if available, otherwise a generic one
-            return fallback_tips.get(platform.lower(), f"Check for seasonal sales and special promotions on {platform} to maximize your savings. Because who doesn't love a good deal? 😏")
+            return self._fallback_tip(platform)
+    
+    def _fallback_tip(self, platform: str) -> str:
+        """
+        Pick a canned shopping tip, used when Gemini is unavailable or skipped
+        Args:
+            platform: The platform name
+        Returns:
+            str: A shopping tip
+        """
+        return fallback_tip(platform)
     
     def generate_coupon_response(self, platform: str) -> str:
         """
@@ -308,9 +642,21 @@ Remember:
             str: A formatted coupon response
         """
         coupon_code = self.generate_coupon_code(platform)
+        tip = self.generate_shopping_tip(platform)
+        return self._format_coupon_response(platform, coupon_code, tip)
+    
+    def _format_coupon_response(self, platform: str, coupon_code: str, tip: str) -> str:
+        """
+        Build a deal card around a coupon code and tip
+        Args:
+            platform: The platform name
+            coupon_code: The coupon code to show
+            tip: The shopping tip to show
+        Returns:
+            str: A formatted coupon response
+        """
         discount = self.generate_discount(platform)
         expiry_date = self.generate_expiry_date()
-        tip = self.generate_shopping_tip(platform)
         
         # Create a more detailed description based on the platform and discount
         details = self._generate_details(platform, discount)
@@ -325,6 +671,31 @@ Remember:
         
         return response
     
+    def _fallback_prompt(self, user_message: str) -> str:
+        """
+        Build the prompt for general messages that no other route handles
+        Args:
+            user_message: The user's input message
+        Returns:
+            str: The prompt
+        """
+        return f"""The user said: '{user_message}'. 
+                You are JUGAAD, an AI shopping assistant with a friendly, conversational tone and a touch of playful sarcasm. Your tagline is "JUGAAD se hi to duniya chalti hai", but use this tagline sparingly - only about 10% of the time.
+                
+                IMPORTANT: You MUST only respond about shopping, deals, discounts, and e-commerce related topics.
+                If the user asks about ANY other topic not related to shopping or commerce, do NOT provide information.
+                Instead, politely tell them you can only help with shopping-related matters.
+                
+                Respond in a friendly, conversational way with a touch of sarcasm but stay strictly on the topic of shopping and deals.
+                Always keep your identity as JUGAAD and focus on being helpful within your domain.
+                Never provide information about topics like science, history, politics, geography, etc.
+                Always default to redirecting to shopping if unsure.
+                
+                Don't provide fake coupons or specific discount codes in this general response.
+                
+                DON'T overuse the tagline "JUGAAD se hi to duniya chalti hai" - use it very sparingly or not at all.
+                """
+    
     def _generate_details(self, platform: str, discount: str) -> str:
         """
         Generate detailed description based on platform and discount
@@ -334,21 +705,7 @@ Remember:
         Returns:
             str: A detailed description
         """
-        if platform.lower() in ["puma", "nike", "adidas", "reebok"]:
-            if "shoes" in discount.lower():
-                return f"Special offer on footwear! Use this code at checkout to get {discount}."
-            elif "apparel" in discount.lower():
-                return f"Exclusive clothing deal! Apply this code to receive {discount}."
-            elif "free" in discount.lower():
-                return f"Limited time offer! {discount} when you shop now."
-            else:
-                return f"Special savings on {platform.capitalize()} products! Use this code to get {discount}."
-        elif "free delivery" in discount.lower():
-            return f"No delivery charges! Use this code to get {discount}."
-        elif "emi" in discount.lower():
-            return f"Easy payment options! {discount} when you use this code."
-        else:
-            return f"Special offer for our valued customers! Use this code at checkout to get {discount}."
+        return generate_details(platform, discount)
     
     def suggest_alternative_companies(self, category: str = None) -> str:
         """
@@ -361,8 +718,7 @@ Remember:
         # Use Gemini to generate alternative suggestions
         try:
             prompt = f"Suggest 2-3 popular online stores or platforms for {category} shopping in India. Make it friendly and conversational."
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate('alternatives', prompt)
         except Exception as e:
             logger.error(f"Error suggesting alternatives: {str(e)}")
             if category == "food":
@@ -385,354 +741,274 @@ Remember:
         Returns:
             str: A formatted coupon response
         """
-        discount = self.generate_discount(platform)
-        expiry_date = self.generate_expiry_date()
         tip = self.generate_shopping_tip(platform)
-        
-        # Create a more detailed description based on the platform and discount
-        details = self._generate_details(platform, discount)
-        
-        # Format the response
-        response = f"""🏷️ CODE: {coupon_code}
-💰 DISCOUNT: {discount}
-🛍️ STORE: {platform.capitalize()}
-📝 DETAILS: {details}
-⏰ VALID TILL: {expiry_date}
-💡 TIP: {tip}"""
-        
-        return response
+        return self._format_coupon_response(platform, coupon_code, tip)
 
-    @rate_limit(max_requests=60, time_window=60)
-    def get_response(self, user_message: str) -> str:
+    def classify(self, user_message: str) -> Route:
         """
-        Get response from the chatbot with rate limiting
+        Decide how a message will be answered without doing any LLM work
         Args:
             user_message: The user's input message
         Returns:
-            str: The chatbot's response
+            Route: The intent plus any platform, coupon code or name it needs
         """
-        try:
-            user_message_lower = user_message.lower()
-            
-            # Check for simple greetings
-            greeting_patterns = ["hi", "hello", "hey", "hola", "namaste", "greetings"]
-            if user_message_lower.strip() in greeting_patterns or user_message_lower.startswith(tuple(g + " " for g in greeting_patterns)):
-                greeting_responses = [
-                    "Namaste! I'm JUGAAD, your personal shopping assistant. What deals can I find for you today? 🛍️",
-                    "Hello there! JUGAAD at your service! Looking for some amazing deals today? 💰",
-                    "Hi! I'm JUGAAD, ready to help you save money on your shopping. What are you looking to buy? 🎁",
-                    "Hey! I'm here to find you the best deals. What can I help you with today? 🏷️",
-                    "Namaste! JUGAAD here! What kind of shopping deals are you looking for? 💼",
-                    "Oh, another shopper looking for deals! How original! 😏 Just kidding, I'm JUGAAD and I'm here to help! What are you shopping for today? 🛍️",
-                    "Well, well, well... if it isn't another person looking to save money! I'm JUGAAD, and I'm here to make your shopping dreams come true! What are you looking for? 💰"
-                ]
-                # Only add the tagline about 20% of the time
-                if random.random() < 0.2:
-                    return random.choice(greeting_responses) + " JUGAAD se hi to duniya chalti hai!"
-                else:
-                    return random.choice(greeting_responses)
-            
-            # Check for "how are you" and similar friendly questions
-            how_are_you_patterns = ["how are you", "how you doing", "how's it going", "how are things", "what's up", "how do you do", "how have you been"]
-            if any(pattern in user_message_lower for pattern in how_are_you_patterns):
-                friendly_responses = [
-                    "I'm doing great, thanks for asking! Ready to help you find some amazing deals today. What are you shopping for? 😊",
-                    "I'm fantastic! Always excited to help shoppers save money. What deals can I find for you? 🛍️",
-                    "I'm wonderful! Thanks for checking in. Now, let's find you some incredible discounts - what are you looking for? 💰",
-                    "Doing excellent and ready to hunt down the best deals for you! What kind of shopping are you interested in today? 🎁",
-                    "I'm always in a great mood when I can help people save money! What shopping deals are you looking for? 🏷️",
-                    "I'm just peachy! Living my best AI life, finding deals for humans like you. What are you shopping for today? 😏",
-                    "Oh, you know, just being an awesome shopping assistant! I'm doing great, thanks for asking. Now, what deals can I find for you? 🛍️"
-                ]
-                return random.choice(friendly_responses)
-            
-            # Check for expressions of thanks
-            thanks_patterns = ["thank you", "thanks", "thx", "thank u", "appreciate it", "grateful"]
-            if any(pattern in user_message_lower for pattern in thanks_patterns) and len(user_message_lower.split()) < 5:
-                thanks_responses = [
-                    "You're very welcome! It's my pleasure to help. Anything else you'd like to find deals on today? 😊",
-                    "Anytime! That's what JUGAAD is here for. Need help with any other shopping deals? 🛍️",
-                    "Happy to help! Let me know if you need any other deals or discounts! 💰",
-                    "My pleasure! Helping shoppers save money makes my day. Anything else you're looking for? 🎁",
-                    "You're welcome! Feel free to ask about any other deals you might need! 🏷️",
-                    "No need to thank me! I'm just doing my job of making your wallet happier. Need anything else? 😏",
-                    "You're welcome! I live for these moments of helping people save money. What else can I find for you? 🛍️"
-                ]
-                return random.choice(thanks_responses)
-            
-            # Check for expressions of goodness/niceness
-            nice_patterns = ["you're nice", "you are nice", "you're good", "you are good", "you're helpful", "you are helpful", "you're amazing", "you are amazing"]
-            if any(pattern in user_message_lower for pattern in nice_patterns):
-                nice_responses = [
-                    "That's so kind of you to say! It makes my day to hear that. What kind of deals can I help you find today? 😊",
-                    "Thank you for the kind words! I'm here to make your shopping experience better. What are you looking to buy? 🛍️",
-                    "Aww, thanks! That means a lot to me. Now, let's find you some amazing deals! What are you shopping for? 💰",
-                    "You just made my day! I'm always here to help you save money. What deals are you looking for? 🎁",
-                    "Thank you! I really appreciate that. Let's find you some great deals - what are you interested in? 🏷️",
-                    "Aww, you're making me blush! (Well, as much as an AI can blush anyway 😏) What deals can I find for you today? 🛍️",
-                    "That's so sweet! I'm just doing my job, but I appreciate the compliment. What else can I help you find? 💰"
-                ]
-                return random.choice(nice_responses)
-            
-            # Check for common chitchat/small talk
-            if user_message_lower in ["good morning", "morning", "good afternoon", "good evening", "evening"]:
-                time_greeting_responses = [
-                    f"{user_message.capitalize()}! It's always a good time to find amazing deals. What are you shopping for today? 😊",
-                    f"{user_message.capitalize()} to you too! Ready to help you find some great savings. What kind of deals are you looking for? 🛍️",
-                    f"{user_message.capitalize()}! Hope you're having a wonderful day. Let's find you some exciting offers - what are you interested in? 💰",
-                    f"{user_message.capitalize()}! Another day, another opportunity to save money. What are you shopping for? 🎁",
-                    f"{user_message.capitalize()}! I'm JUGAAD, and I'm here to make your shopping experience better. What deals can I find for you? 🏷️"
-                ]
-                return random.choice(time_greeting_responses)
-            
-            # Handle basic yes/no responses
-            if user_message_lower in ["yes", "yeah", "yep", "sure", "okay", "ok", "yup"]:
-                affirmative_responses = [
-                    "Great! What kind of deals or coupons are you looking for today? 😊",
-                    "Excellent! Tell me what you're shopping for, and I'll find you the best deals! 🛍️",
-                    "Perfect! What products or stores would you like coupons for? 💰",
-                    "Wonderful! What are you looking to save money on today? 🎁",
-                    "Awesome! What kind of shopping deals can I help you find? 🏷️",
-                    "Fantastic! I was just waiting for someone to ask about deals today. What are you shopping for? 😏",
-                    "Brilliant! Let's find you some amazing savings. What are you looking to buy? 🛍️"
-                ]
-                return random.choice(affirmative_responses)
-                
-            if user_message_lower in ["no", "nope", "nah", "not now", "not really"]:
-                negative_responses = [
-                    "No problem! I'm here whenever you need to find great deals. Just let me know what you're looking for! 😊",
-                    "That's okay! Feel free to ask when you're ready to find some amazing discounts. 🛍️",
-                    "Sure thing! When you're ready to shop, I'll be here to help you save money. 💰",
-                    "No worries! I'm here anytime you need help finding deals and coupons. 🎁",
-                    "That's fine! Just let me know when you want to find some great shopping deals. 🏷️",
-                    "Oh, you're one of those 'I don't need deals' people? I'll be here when you change your mind! 😏",
-                    "No problem! I'm not going anywhere. Your wallet will thank me later when you're ready to save! 🛍️"
-                ]
-                return random.choice(negative_responses)
-            
-            # Check if the user is asking about the chatbot's identity
-            identity_keywords = ["name", "who are you", "what are you", "your name", "introduce yourself", "tell me about yourself"]
-            if any(keyword in user_message_lower for keyword in identity_keywords):
-                identity_responses = [
-                    "I'm JUGAAD! I'm your personal shopping assistant, always ready to help you find the best deals and save money! 🎉",
-                    "My name is JUGAAD! I'm here to help you find amazing discounts and shopping deals! 💰",
-                    "I'm JUGAAD, your AI shopping assistant focused on finding you the best deals and coupons! 🛍️",
-                    "JUGAAD here! I help shoppers like you save money with great deals and discounts! 🏷️",
-                    "I'm JUGAAD, your friendly neighborhood shopping assistant! I'm here to make your wallet happier! 🎁",
-                    "The name's JUGAAD, shopping assistant extraordinaire! I'm here to find you the best deals in town! 💰",
-                    "I'm JUGAAD, and I'm probably the only AI that gets excited about finding you discounts! 🛍️"
-                ]
-                # Include tagline only about 30% of the time for identity questions
-                if random.random() < 0.3:
-                    return random.choice(identity_responses) + " JUGAAD se hi to duniya chalti hai!"
-                else:
-                    return random.choice(identity_responses)
-            
-            # Check if user is introducing themselves
-            user_intro_patterns = [
-                r"my name is (\w+)",
-                r"i am (\w+)",
-                r"i'm (\w+)",
-                r"call me (\w+)"
-            ]
-            
-            for pattern in user_intro_patterns:
-                match = re.search(pattern, user_message_lower)
-                if match:
-                    user_name = match.group(1).capitalize()
-                    greeting_responses = [
-                        f"Nice to meet you, {user_name}! I'm JUGAAD, your personal shopping assistant. What kind of deals are you looking for today? 🛍️",
-                        f"Hello {user_name}! JUGAAD at your service! Can I help you find any special deals or discounts? 💰",
-                        f"Hi {user_name}! Great to meet you! What shopping deals can I find for you today? 🎁",
-                        f"Good to meet you, {user_name}! I'm JUGAAD, and I'm here to help you save money on your shopping! 💼",
-                        f"Hey {user_name}! I'm JUGAAD, and I'm excited to help you find some amazing deals! What are you shopping for? 🛍️",
-                        f"Welcome, {user_name}! I'm JUGAAD, and I'm here to make your shopping experience better. What deals can I find for you? 💰",
-                        f"Hello there, {user_name}! I'm JUGAAD, and I'm ready to help you save money. What are you looking to buy? 🎁"
-                    ]
-                    # Add tagline only 15% of the time for personal introductions
-                    if random.random() < 0.15:
-                        return random.choice(greeting_responses) + " JUGAAD se hi to duniya chalti hai!"
-                    else:
-                        return random.choice(greeting_responses)
-            
-            # Check if the message contains a specific coupon code
-            specific_coupon_code = None
-            # Look for patterns like "Use code XXXX" or "code XXXX"
-            code_patterns = [
-                r"use code\s+([A-Z0-9]+)",
-                r"code\s+([A-Z0-9]+)",
-                r"coupon\s+([A-Z0-9]+)",
-                r"promo\s+([A-Z0-9]+)",
-                r"voucher\s+([A-Z0-9]+)"
-            ]
-            
-            for pattern in code_patterns:
-                match = re.search(pattern, user_message_lower)
-                if match:
-                    specific_coupon_code = match.group(1).upper()
+        user_message_lower = user_message.lower()
+
+        # Check the canned intents (greetings, thanks, yes/no, identity, ...)
+        route = match_canned_intent(user_message_lower)
+        if route is not None:
+            return route
+
+        # Check if the message contains a specific coupon code
+        specific_coupon_code = None
+        # Look for patterns like "Use code XXXX" or "code XXXX"
+        code_patterns = [
+            r"use code\s+([A-Z0-9]+)",
+            r"code\s+([A-Z0-9]+)",
+            r"coupon\s+([A-Z0-9]+)",
+            r"promo\s+([A-Z0-9]+)",
+            r"voucher\s+([A-Z0-9]+)"
+        ]
+
+        for pattern in code_patterns:
+            match = re.search(pattern, user_message_lower)
+            if match:
+                specific_coupon_code = match.group(1).upper()
+                break
+
+        # Check if the message is asking for a coupon code
+        platforms = list(self.real_companies.keys())
+
+        # Check for coupon-related keywords
+        coupon_keywords = ["coupon", "code", "deal", "discount", "offer", "save", "promo", "voucher", "give me"]
+        is_coupon_request = any(keyword in user_message_lower for keyword in coupon_keywords)
+
+        # Extract company name from the message
+        company_name = None
+        for platform in platforms:
+            for variation in self.real_companies[platform]:
+                if variation in user_message_lower:
+                    company_name = platform
                     break
-            
-            # Check if the message is asking for a coupon code
-            platforms = list(self.real_companies.keys())
-            
-            # Check for coupon-related keywords
-            coupon_keywords = ["coupon", "code", "deal", "discount", "offer", "save", "promo", "voucher", "give me"]
-            is_coupon_request = any(keyword in user_message_lower for keyword in coupon_keywords)
-            
-            # Extract company name from the message
-            company_name = None
-            for platform in platforms:
-                for variation in self.real_companies[platform]:
-                    if variation in user_message_lower:
-                        company_name = platform
+            if company_name:
+                break
+
+        # If no company was found, check for direct mentions of store names that might not be in our list
+        if not company_name:
+            # Check for common store names that might not be in our predefined list
+            words = user_message_lower.split()
+            for word in words:
+                # If word is at least 3 letters and not a common word, check if it might be a store name
+                if len(word) >= 3 and word not in ["the", "and", "for", "from", "with", "that", "this", "have", "what"]:
+                    if word in ["puma", "nike", "adidas", "reebok"]:
+                        company_name = word
                         break
-                if company_name:
-                    break
-            
-            # If no company was found, check for direct mentions of store names that might not be in our list
-            if not company_name:
-                # Check for common store names that might not be in our predefined list
-                words = user_message_lower.split()
-                for word in words:
-                    # If word is at least 3 letters and not a common word, check if it might be a store name
-                    if len(word) >= 3 and word not in ["the", "and", "for", "from", "with", "that", "this", "have", "what"]:
-                        if word in ["puma", "nike", "adidas", "reebok"]:
-                            company_name = word
-                            break
-                        # Check if it's a clothing/shoes brand
-                        elif word in ["shoes", "clothing", "apparel", "footwear"]:
-                            # Default to a popular brand
-                            company_name = random.choice(["puma", "nike", "adidas", "reebok"])
-                            break
-            
-            # If it's a coupon request or contains a company name
-            if is_coupon_request or company_name:
-                # If we found a company name, generate a coupon
-                if company_name:
+                    # Check if it's a clothing/shoes brand
+                    elif word in ["shoes", "clothing", "apparel", "footwear"]:
+                        # Default to a popular brand
+                        company_name = random.choice(["puma", "nike", "adidas", "reebok"])
+                        break
+
+        # If it's a coupon request or contains a company name
+        if is_coupon_request or company_name:
+            # If we found a company name, generate a coupon
+            if company_name:
+                return Route("deal", platform=company_name, coupon_code=specific_coupon_code)
+            # If no company name was found but it's a direct coupon request
+            if is_coupon_request and any(word in user_message_lower for word in ["just", "give", "code", "coupon"]):
+                # Check if the message mentions shoes or fashion
+                if any(word in user_message_lower for word in ["shoe", "shoes", "footwear", "sneaker", "trainer"]):
+                    default_platform = random.choice(["puma", "nike", "adidas", "reebok"])
+                elif any(word in user_message_lower for word in ["fashion", "clothes", "clothing", "apparel"]):
+                    default_platform = random.choice(["myntra", "ajio", "fashion"])
+                elif any(word in user_message_lower for word in ["food", "restaurant", "delivery", "eat"]):
+                    default_platform = random.choice(["zomato", "swiggy", "food"])
+                else:
+                    default_platform = random.choice(["amazon", "flipkart", "myntra"])
+                return Route("deal", platform=default_platform, coupon_code=specific_coupon_code)
+            # Ask for clarification
+            return Route("clarification")
+
+        # Determine if the message is clearly off-topic
+        clearly_offtopic_keywords = [
+            "politics", "news", "weather", "sports", "movie", "tv show", "religion",
+            "math", "science", "history", "philosophy", "joke", "story", "recipe",
+            "calculate", "solve", "explain why", "explain how", "what is the meaning of",
+            "who invented", "when was", "where is", "teach me", "tell me about", "write",
+            "poetry", "song", "music", "health", "medicine", "disease", "advice",
+            "earth", "sun", "moon", "planet", "star", "space", "universe", "galaxy",
+            "animal", "plant", "biology", "chemistry", "physics", "geography", "ocean",
+            "country", "language", "education", "technology", "computer", "internet",
+            "war", "president", "king", "queen", "leader", "government", "law", "culture"
+        ]
+
+        # Additional check for common off-topic question patterns
+        offtopic_patterns = [
+            r"^what is ([a-z ]+)$",
+            r"^who is ([a-z ]+)$",
+            r"^how does ([a-z ]+) work$",
+            r"^why does ([a-z ]+)",
+            r"^tell me about ([a-z ]+)$",
+            r"^explain ([a-z ]+)$"
+        ]
+
+        # If the message contains clear off-topic keywords or matches off-topic patterns
+        if any(keyword in user_message_lower for keyword in clearly_offtopic_keywords):
+            return Route("offtopic")
+
+        for pattern in offtopic_patterns:
+            match = re.search(pattern, user_message_lower)
+            if match:
+                topic = match.group(1)
+                # Only consider it off-topic if the topic isn't shopping-related
+                shopping_related_terms = ["shop", "buy", "deal", "coupon", "discount", "offer", "sale", "price", "store", "mall", "online", "brand", "product"]
+                if not any(term in topic for term in shopping_related_terms):
+                    return Route("offtopic")
+
+        # For other messages that aren't clearly off-topic, reuse a cached answer or use the API
+        return Route("fallback", cached_response=self.response_cache.get(user_message))
+
+    def _canned_reply(self, route: Route, user_message: str) -> str:
+        """
+        Pick a fixed reply for a fast-path intent
+        Args:
+            route: The classified route
+            user_message: The user's input message
+        Returns:
+            str: The reply, sometimes followed by the tagline
+        """
+        reply = random.choice(self.canned_responses[route.intent]).format(
+            message=user_message.capitalize(), name=route.user_name)
+        if random.random() < self.tagline_rates.get(route.intent, 0):
+            reply += TAGLINE
+        return reply
+
+    def get_response(self, user_message: str, route: Optional[Route] = None) -> str:
+        """
+        Get response from the chatbot
+        Args:
+            user_message: The user's input message
+            route: A route already produced by classify(), if any
+        Returns:
+            str: The chatbot's response
+        """
+        try:
+            if route is None:
+                with profiling.span('routing'):
+                    route = self.classify(user_message)
+
+            if route.cached_response is not None:
+                return route.cached_response
+
+            if not route.llm_bound:
+                return self._canned_reply(route, user_message)
+
+            if route.intent == "deal":
+                # Deal cards are meant to be fresh each time
+                mark_uncacheable()
+                with profiling.span('deal_cards'):
                     # Generate a coupon response
-                    if specific_coupon_code:
+                    if route.coupon_code:
                         # Use the specific coupon code provided by the user
-                        coupon_response = self.generate_coupon_response_with_code(company_name, specific_coupon_code)
+                        coupon_response = self.generate_coupon_response_with_code(route.platform, route.coupon_code)
                     else:
-                        coupon_response = self.generate_coupon_response(company_name)
-                    
+                        coupon_response = self.generate_coupon_response(route.platform)
+
                     # Generate a friendly introduction
-                    intro = self.generate_friendly_intro(company_name)
-                    
-                    return f"{intro}\n\n{coupon_response}"
-                else:
-                    # If no company name was found but it's a direct coupon request
-                    if is_coupon_request and any(word in user_message_lower for word in ["just", "give", "code", "coupon"]):
-                        # Check if the message mentions shoes or fashion
-                        if any(word in user_message_lower for word in ["shoe", "shoes", "footwear", "sneaker", "trainer"]):
-                            default_platform = random.choice(["puma", "nike", "adidas", "reebok"])
-                        elif any(word in user_message_lower for word in ["fashion", "clothes", "clothing", "apparel"]):
-                            default_platform = random.choice(["myntra", "ajio", "fashion"])
-                        elif any(word in user_message_lower for word in ["food", "restaurant", "delivery", "eat"]):
-                            default_platform = random.choice(["zomato", "swiggy", "food"])
-                        else:
-                            default_platform = random.choice(["amazon", "flipkart", "myntra"])
-                        
-                        if specific_coupon_code:
-                            # Use the specific coupon code provided by the user
-                            coupon_response = self.generate_coupon_response_with_code(default_platform, specific_coupon_code)
-                        else:
-                            coupon_response = self.generate_coupon_response(default_platform)
-                            
-                        intro = self.generate_friendly_intro(default_platform)
-                        return f"{intro}\n\n{coupon_response}"
-                    else:
-                        # Ask for clarification using Gemini
-                        try:
-                            prompt = "Generate a short, friendly response with a touch of sarcasm asking which store or category they want a coupon for. Be direct about providing real coupons. Keep it conversational and helpful."
-                            clarification_response = self.model.generate_content(prompt)
-                            return clarification_response.text.strip()
-                        except Exception as e:
-                            logger.error(f"Error generating clarification: {str(e)}")
-                            return "Which store would you like a coupon for? I have deals for all major brands! (And yes, I'm actually excited to share them!) 🛍️"
-            
-            # Determine if the message is clearly off-topic
-            clearly_offtopic_keywords = [
-                "politics", "news", "weather", "sports", "movie", "tv show", "religion",
-                "math", "science", "history", "philosophy", "joke", "story", "recipe",
-                "calculate", "solve", "explain why", "explain how", "what is the meaning of",
-                "who invented", "when was", "where is", "teach me", "tell me about", "write",
-                "poetry", "song", "music", "health", "medicine", "disease", "advice",
-                "earth", "sun", "moon", "planet", "star", "space", "universe", "galaxy", 
-                "animal", "plant", "biology", "chemistry", "physics", "geography", "ocean",
-                "country", "language", "education", "technology", "computer", "internet",
-                "war", "president", "king", "queen", "leader", "government", "law", "culture"
-            ]
-            
-            # Additional check for common off-topic question patterns
-            offtopic_patterns = [
-                r"^what is ([a-z ]+)$",
-                r"^who is ([a-z ]+)$",
-                r"^how does ([a-z ]+) work$",
-                r"^why does ([a-z ]+)",
-                r"^tell me about ([a-z ]+)$",
-                r"^explain ([a-z ]+)$"
-            ]
-            
-            # If the message contains clear off-topic keywords or matches off-topic patterns
-            is_offtopic = any(keyword in user_message_lower for keyword in clearly_offtopic_keywords)
-            
-            if not is_offtopic:
-                for pattern in offtopic_patterns:
-                    match = re.search(pattern, user_message_lower)
-                    if match:
-                        topic = match.group(1)
-                        # Only consider it off-topic if the topic isn't shopping-related
-                        shopping_related_terms = ["shop", "buy", "deal", "coupon", "discount", "offer", "sale", "price", "store", "mall", "online", "brand", "product"]
-                        if not any(term in topic for term in shopping_related_terms):
-                            is_offtopic = True
-                            break
-            
-            if is_offtopic:
-                out_of_domain_responses = [
-                    "As JUGAAD, I'm only designed to help with shopping deals and discounts. I don't have information about that topic. What kind of product deals are you looking for today? 🛍️",
-                    "My expertise is strictly limited to shopping deals and discounts. I can't answer that question. Can I help you find a great deal instead? 💰",
-                    "I'm JUGAAD, your shopping assistant. I don't have information about topics outside shopping and deals. I'd be happy to help you find discounts on products though! 🏷️",
-                    "Sorry, that's outside my expertise. JUGAAD is only programmed to help with shopping deals and discounts. What are you looking to buy today? I can find you some great savings! 🎁",
-                    "I'm JUGAAD - I focus exclusively on shopping deals. I don't have information about that topic. Let me help you save money on your next purchase instead! What are you shopping for? 💼",
-                    "Oh, you're asking about something other than shopping? How refreshing! 😏 But I'm JUGAAD, and I'm here to help you save money. What are you shopping for today? 🛍️",
-                    "Interesting question! But I'm just a shopping assistant, not a know-it-all AI. Let's focus on what I do best - finding you amazing deals. What are you shopping for? 💰"
-                ]
-                
-                # Add tagline only 10% of the time for off-topic redirects
-                if random.random() < 0.1:
-                    return random.choice(out_of_domain_responses) + " JUGAAD se hi to duniya chalti hai!"
-                else:
-                    return random.choice(out_of_domain_responses)
-            
-            # For other messages that aren't clearly off-topic, use the API
+                    intro = self.generate_friendly_intro(route.platform)
+
+                return f"{intro}\n\n{coupon_response}"
+
+            if route.intent == "clarification":
+                # Ask for clarification using Gemini
+                try:
+                    prompt = "Generate a short, friendly response with a touch of sarcasm asking which store or category they want a coupon for. Be direct about providing real coupons. Keep it conversational and helpful."
+                    return self._generate('clarification', prompt)
+                except Exception as e:
+                    logger.error(f"Error generating clarification: {str(e)}")
+                    mark_uncacheable()
+                    return CLARIFICATION_FALLBACK
+
             try:
-                prompt = f"""The user said: '{user_message}'. 
-                You are JUGAAD, an AI shopping assistant with a friendly, conversational tone and a touch of playful sarcasm. Your tagline is "JUGAAD se hi to duniya chalti hai", but use this tagline sparingly - only about 10% of the time.
-                
-                IMPORTANT: You MUST only respond about shopping, deals, discounts, and e-commerce related topics.
-                If the user asks about ANY other topic not related to shopping or commerce, do NOT provide information.
-                Instead, politely tell them you can only help with shopping-related matters.
-                
-                Respond in a friendly, conversational way with a touch of sarcasm but stay strictly on the topic of shopping and deals.
-                Always keep your identity as JUGAAD and focus on being helpful within your domain.
-                Never provide information about topics like science, history, politics, geography, etc.
-                Always default to redirecting to shopping if unsure.
-                
-                Don't provide fake coupons or specific discount codes in this general response.
-                
-                DON'T overuse the tagline "JUGAAD se hi to duniya chalti hai" - use it very sparingly or not at all.
-                """
-                api_response = self.model.generate_content(prompt)
-                return api_response.text.strip()
+                prompt = self._fallback_prompt(user_message)
+                response = self._generate('fallback', prompt)
+                self.response_cache.put(user_message, response)
+                return response
             except Exception as e:
                 logger.error(f"Error generating API response: {str(e)}")
-                return "I'm JUGAAD, your shopping deals expert! How can I help you find great deals today? 🛍️"
-            
+                mark_uncacheable()
+                return GENERAL_FALLBACK
+
         except Exception as e:
             error_msg = f"Error getting response from Gemini: {str(e)}"
             logger.error(error_msg)
-            return f"I apologize, but I encountered an error. Please try again later. Error: {str(e)}"
+            return self.error_response(e)
+
+    def error_response(self, error: Exception) -> str:
+        """The in-chat apology shown when answering a message fails"""
+        mark_uncacheable()
+        return f"I apologize, but I encountered an error. Please try again later. Error: {str(error)}"
+
+    def stream_response(self, user_message: str, route: Optional[Route] = None,
+                        cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Get the chatbot's response as incremental chunks; only general
+        fallback answers are streamed, other routes arrive in one chunk.
+        Cancelling stops a streamed answer at the next chunk; other routes
+        finish their Gemini calls first
+        Args:
+            user_message: The user's input message
+            route: A route already produced by classify(), if any
+            cancelled: Set to abandon the response part-way
+        Yields:
+            str: Response text chunks
+        Raises:
+            Exception: The stream failed after some chunks were sent, so the answer is incomplete
+        """
+        cancelled = cancelled or threading.Event()
+        if route is None:
+            route = self.classify(user_message)
+        if route.intent != "fallback" or not route.llm_bound:
+            yield self.get_response(user_message, route)
+            return
+
+        chunks = []
+        try:
+            for chunk in self._generate_stream('fallback', self._fallback_prompt(user_message), cancelled):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error streaming API response: {str(e)}")
+            if chunks:
+                raise
+            mark_uncacheable()
+            yield GENERAL_FALLBACK
+            return
+        if chunks and not cancelled.is_set():
+            self.response_cache.put(user_message, "".join(chunks).strip())
+    
+    def degraded_response(self, route: Route, user_message: str) -> str:
+        """
+        Answer an LLM-bound route without calling Gemini, used when shedding load
+        Args:
+            route: The classified route
+            user_message: The user's input message
+        Returns:
+            str: A canned response for the route
+        """
+        if route.llm_bound:
+            mark_uncacheable()
+        if route.intent == "deal":
+            coupon_code = route.coupon_code or self.generate_coupon_code(route.platform)
+            coupon_response = self._format_coupon_response(route.platform, coupon_code, self._fallback_tip(route.platform))
+            return f"{self._fallback_intro(route.platform)}\n\n{coupon_response}"
+        if route.intent == "clarification":
+            return CLARIFICATION_FALLBACK
+        if route.cached_response is not None:
+            return route.cached_response
+        if not route.llm_bound:
+            return self._canned_reply(route, user_message)
+        return GENERAL_FALLBACK
 
     def generate_friendly_intro(self, platform: str) -> str:
         """
@@ -755,8 +1031,7 @@ Remember:
         prompt = random.choice(prompt_templates)
         
         try:
-            response = self.model.generate_content(prompt)
-            intro = response.text.strip()
+            intro = self._generate('intro', prompt)
             
             # If the intro is too long (more than 120 chars), try to get a shorter one
             if len(intro) > 120:
@@ -765,18 +1040,27 @@ Remember:
             return intro
         except Exception as e:
             logger.error(f"Error generating friendly intro: {str(e)}")
-            
-            # Fallback intros if API fails - now with more sarcasm
-            fallback_intros = [
-                f"Found a great {platform} deal for you! 🛍️",
-                f"Here's a {platform} offer you might like! (And yes, I'm actually excited about it!)",
-                f"Check out this {platform} discount I found! Your wallet will thank me later.",
-                f"Just spotted this {platform} deal for you! Another day, another savings opportunity!",
-                f"Great timing! Found a {platform} offer you might enjoy. I'm practically a shopping superhero!",
-                f"Take a look at this {platform} savings opportunity! Your bank account might actually smile for once.",
-                f"I've found something good on {platform} for you! No, I'm not just saying that to be nice."
-            ]
-            return random.choice(fallback_intros)
+            return self._fallback_intro(platform)
+    
+    def _fallback_intro(self, platform: str) -> str:
+        """
+        Pick a canned deal introduction, used when Gemini is unavailable or skipped
+        Args:
+            platform: The platform name
+        Returns:
+            str: A friendly introduction message
+        """
+        # Fallback intros if API fails - now with more sarcasm
+        fallback_intros = [
+            f"Found a great {platform} deal for you! 🛍️",
+            f"Here's a {platform} offer you might like! (And yes, I'm actually excited about it!)",
+            f"Check out this {platform} discount I found! Your wallet will thank me later.",
+            f"Just spotted this {platform} deal for you! Another day, another savings opportunity!",
+            f"Great timing! Found a {platform} offer you might enjoy. I'm practically a shopping superhero!",
+            f"Take a look at this {platform} savings opportunity! Your bank account might actually smile for once.",
+            f"I've found something good on {platform} for you! No, I'm not just saying that to be nice."
+        ]
+        return random.choice(fallback_intros)
 
 def main():
     """Main function to run the chatbot"""
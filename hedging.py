@@ -0,0 +1,266 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from scheduler import percentile
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Marks a stream that ended before its first item
+_END = object()
+
+
+def parse_sites(spec: str) -> Dict[str, float]:
+    """
+    Parse a hedged call site list such as "fallback:95,clarification:90"
+    Args:
+        spec: Comma-separated site:percentile pairs; a bare site uses the 95th percentile
+    Returns:
+        Dict[str, float]: Percentile to hedge at for each site
+    """
+    sites = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        site, _, pct = item.partition(':')
+        sites[site.strip()] = float(pct) if pct else 95.0
+    return sites
+
+
+class _SiteStats:
+    """Latency samples and counters for one call site"""
+
+    def __init__(self, window: int):
+        self.attempts = deque(maxlen=window)
+        self.end_to_end = deque(maxlen=window)
+        self.saved = deque(maxlen=window)
+        self.counts = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0, 'errors': 0}
+
+
+def _summary(samples) -> Dict[str, float]:
+    return {name: round(percentile(samples, pct), 3) for name, pct in (('p50', 50), ('p95', 95), ('p99', 99))}
+
+
+class Hedger:
+    """
+    Issues a duplicate ("hedge") request when a call outlives its site's
+    tracked latency percentile, returns whichever answer comes first and
+    cancels the other. A token bucket earns a fraction of a hedge per call,
+    capping extra load at that fraction of calls.
+
+    A cancelled primary's latency is unknown, so for a sample of hedge wins
+    the primary is left to finish and the time the hedge saved is recorded.
+
+    Streams are hedged on the wait for their first item, tracked under
+    "<site>:first_chunk" with the site's percentile.
+    """
+
+    def __init__(self, sites: Optional[Dict[str, float]] = None, budget_ratio: float = 0.05,
+                 max_burst: float = 10, min_samples: int = 20, default_delay: float = 2.0,
+                 window: int = 512, max_workers: int = 16, shadow_rate: float = 0.1):
+        """
+        Args:
+            sites: Percentile to hedge at for each call site; other sites are never hedged
+            budget_ratio: Hedges earned per call
+            max_burst: Most hedges the budget can save up
+            min_samples: Samples needed before the percentile replaces default_delay
+            default_delay: Seconds to wait before hedging while a site has too few samples
+            window: Latency samples kept per site
+            max_workers: Threads available to hedged calls
+            shadow_rate: Fraction of hedge wins whose primary runs to completion to measure the saving
+        """
+        self.sites = sites or {}
+        self.budget_ratio = budget_ratio
+        self.max_burst = max_burst
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.window = window
+        self.shadow_rate = shadow_rate
+        self._tokens = 0.0
+        self._stats: Dict[str, _SiteStats] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jugaad-hedge') if self.sites else None
+
+    @classmethod
+    def from_env(cls) -> 'Hedger':
+        """Build a hedger from the HEDGE_* environment variables; hedging is off unless HEDGE_SITES is set"""
+        return cls(
+            sites=parse_sites(os.getenv('HEDGE_SITES', '')),
+            budget_ratio=float(os.getenv('HEDGE_BUDGET', '0.05')),
+            default_delay=float(os.getenv('HEDGE_DEFAULT_DELAY', '2')),
+            max_workers=int(os.getenv('HEDGE_MAX_WORKERS', '16')),
+            shadow_rate=float(os.getenv('HEDGE_SHADOW_RATE', '0.1'))
+        )
+
+    def enabled(self, site: str) -> bool:
+        """Whether calls from a site are hedged"""
+        return site in self.sites
+
+    def _site(self, site: str) -> _SiteStats:
+        if site not in self._stats:
+            self._stats[site] = _SiteStats(self.window)
+        return self._stats[site]
+
+    @staticmethod
+    def _base_site(key: str) -> str:
+        return key.partition(':')[0]
+
+    def _delay(self, key: str) -> float:
+        with self._lock:
+            samples = list(self._site(key).attempts)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        return percentile(samples, self.sites[self._base_site(key)])
+
+    def _spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _attempt(self, site: str, fn: Callable[[threading.Event], T], cancelled: threading.Event) -> T:
+        start = time.monotonic()
+        result = fn(cancelled)
+        if not cancelled.is_set():
+            with self._lock:
+                self._site(site).attempts.append(time.monotonic() - start)
+        return result
+
+    def call(self, site: str, fn: Callable[[threading.Event], T]) -> T:
+        """
+        Run fn, hedging it if the site is configured for hedging
+        Args:
+            site: The call site name
+            fn: The call; it should stop early once its event is set
+        Returns:
+            The first successful result
+        """
+        if not self.enabled(site):
+            return fn(threading.Event())
+        return self._hedge(site, fn)
+
+    def stream(self, site: str, fn: Callable[[threading.Event], Iterator[T]],
+               cancelled: threading.Event) -> Iterator[T]:
+        """
+        Stream fn's items, hedging the wait for the first one; the stream
+        that yields first is kept and the other cancelled
+        Args:
+            site: The call site name
+            fn: Opens the stream; it should stop early once its event is set
+            cancelled: Set to stop the kept stream early
+        Yields:
+            The kept stream's items
+        """
+        if not self.enabled(site):
+            yield from fn(cancelled)
+            return
+
+        def opening(attempt_cancel: threading.Event):
+            items = fn(attempt_cancel)
+            return next(items, _END), items
+
+        first, items = self._hedge(f"{site}:first_chunk", opening)
+        try:
+            if first is _END:
+                return
+            yield first
+            for item in items:
+                if cancelled.is_set():
+                    break
+                yield item
+        finally:
+            items.close()
+
+    def _hedge(self, site: str, fn: Callable[[threading.Event], T]) -> T:
+        with self._lock:
+            self._tokens = min(self.max_burst, self._tokens + self.budget_ratio)
+            self._site(site).counts['calls'] += 1
+
+        start = time.monotonic()
+        primary_cancel = threading.Event()
+        primary = self._pool.submit(self._attempt, site, fn, primary_cancel)
+        attempts = {primary: primary_cancel}
+        hedge = None
+
+        done, _ = wait([primary], timeout=self._delay(site))
+        if not done:
+            if self._spend():
+                hedge_cancel = threading.Event()
+                hedge = self._pool.submit(self._attempt, site, fn, hedge_cancel)
+                attempts[hedge] = hedge_cancel
+                logger.info(f"Hedging slow {site} call")
+            else:
+                with self._lock:
+                    self._site(site).counts['budget_denied'] += 1
+
+        pending = set(attempts)
+        error = None
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = future
+                    break
+                error = error or future.exception()
+
+        elapsed = time.monotonic() - start
+        shadow = winner is hedge and hedge is not None and random.random() < self.shadow_rate
+        for future, cancel in attempts.items():
+            if future is winner:
+                continue
+            if shadow and future is primary:
+                primary.add_done_callback(lambda f: self._record_saving(site, start, elapsed, f))
+                continue
+            cancel.set()
+            future.cancel()
+
+        with self._lock:
+            stats = self._site(site)
+            if hedge is not None:
+                stats.counts['hedged'] += 1
+            if winner is None:
+                stats.counts['errors'] += 1
+            else:
+                stats.end_to_end.append(elapsed)
+                if winner is hedge:
+                    stats.counts['hedge_wins'] += 1
+
+        if winner is None:
+            raise error
+        return winner.result()
+
+    def _record_saving(self, site: str, start: float, elapsed: float, primary) -> None:
+        if primary.exception() is None:
+            with self._lock:
+                self._site(site).saved.append(time.monotonic() - start - elapsed)
+
+    def stats(self) -> Dict:
+        """Return per-site tail latency with and without hedging and the extra calls spent"""
+        with self._lock:
+            sites = {}
+            for site, stats in self._stats.items():
+                pct = self.sites.get(self._base_site(site))
+                attempts = [s * 1000 for s in stats.attempts]
+                end_to_end = [s * 1000 for s in stats.end_to_end]
+                saved = [s * 1000 for s in stats.saved]
+                calls = stats.counts['calls']
+                sites[site] = {
+                    'percentile': pct,
+                    'hedge_delay_ms': round(percentile(attempts, pct), 3)
+                    if len(attempts) >= self.min_samples else self.default_delay * 1000,
+                    'extra_call_ratio': round(stats.counts['hedged'] / calls, 4) if calls else 0.0,
+                    # Single attempts that finished; cancelled slow attempts are missing, so the tail reads low
+                    'attempt_ms': _summary(attempts),
+                    'end_to_end_ms': _summary(end_to_end),
+                    # Measured on shadowed hedge wins: how much later the primary finished
+                    'saved_ms': {**_summary(saved), 'samples': len(saved)},
+                    **stats.counts
+                }
+            return {'budget_ratio': self.budget_ratio, 'budget_tokens': round(self._tokens, 3), 'sites': sites}
@@ -0,0 +1,137 @@
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from flask import Response, abort, redirect, request, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Cache-Control for URLs whose content can never change
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_COMPRESSIBLE_TYPES = ('application/javascript', 'application/json', 'image/svg+xml', 'text/javascript')
+
+
+def _compressible(mimetype: str) -> bool:
+    return mimetype.startswith('text/') or mimetype in _COMPRESSIBLE_TYPES
+
+
+class CachedBody:
+    """
+    A response body that never changes while the process runs, kept with
+    precompressed variants and served with ETag/Last-Modified validators
+    """
+
+    def __init__(self, data: bytes, mimetype: str, last_modified: Optional[datetime] = None,
+                 min_size: int = 256):
+        """
+        Args:
+            data: The uncompressed body
+            mimetype: The body's content type
+            last_modified: When the content last changed; defaults to now
+            min_size: Smallest compressible body worth compressing
+        """
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        self.last_modified = (last_modified or datetime.now(timezone.utc)).replace(microsecond=0)
+        self.variants: Dict[str, bytes] = {'identity': data}
+        if _compressible(mimetype) and len(data) >= min_size:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.variants['br'] = compressed
+
+    def _negotiate(self) -> str:
+        offered = [encoding for encoding in ('br', 'gzip') if encoding in self.variants]
+        return request.accept_encodings.best_match(offered) or 'identity'
+
+    def response(self, cache_control: str) -> Response:
+        """
+        Build the response for the current request, or a 304 if the client's copy is current
+        Args:
+            cache_control: The Cache-Control header value
+        Returns:
+            Response: The negotiated variant or a 304
+        """
+        encoding = self._negotiate()
+        response = Response(self.variants[encoding], mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = cache_control
+        response.set_etag(f"{self.digest}-{encoding}")
+        response.last_modified = self.last_modified
+        return response.make_conditional(request)
+
+
+class StaticAssets:
+    """
+    Serves the static folder under fingerprinted URLs
+    (/assets/<digest>/<path>) with immutable caching. Every file is read,
+    hashed and compressed once at startup, so the templates' asset_url()
+    changes whenever a file's content does
+    """
+
+    def __init__(self, app=None, url_prefix: str = '/assets'):
+        self.url_prefix = url_prefix
+        self.assets: Dict[str, CachedBody] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Load the app's static folder and register the asset route and asset_url()"""
+        self.load(app.static_folder)
+        app.add_url_rule(f"{self.url_prefix}/<digest>/<path:filename>", 'asset', self.serve)
+        app.context_processor(lambda: {'asset_url': self.url})
+
+    def load(self, folder: str) -> None:
+        """
+        Read, fingerprint and precompress every file in a folder
+        Args:
+            folder: The static folder
+        """
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, folder).replace(os.sep, '/')
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                with open(path, 'rb') as f:
+                    data = f.read()
+                modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+                self.assets[filename] = CachedBody(data, mimetype, last_modified=modified)
+        logger.info(f"Loaded {len(self.assets)} static assets"
+                    f" ({'gzip and brotli' if brotli is not None else 'gzip'} variants)")
+
+    def url(self, filename: str) -> str:
+        """
+        Fingerprinted URL for a static file
+        Args:
+            filename: Path relative to the static folder
+        Returns:
+            str: The asset URL, or the plain static URL for unknown files
+        """
+        asset = self.assets.get(filename)
+        if asset is None:
+            return url_for('static', filename=filename)
+        return f"{self.url_prefix}/{asset.digest}/{filename}"
+
+    def serve(self, digest: str, filename: str) -> Response:
+        asset = self.assets.get(filename)
+        if asset is None:
+            abort(404)
+        if digest != asset.digest:
+            # Stale fingerprint from an older page; point at the current content
+            return redirect(self.url(filename))
+        return asset.response(IMMUTABLE)
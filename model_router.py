@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Iterator, Optional
+
+import google.generativeai as genai
+
+from scheduler import percentile
+
+logger = logging.getLogger(__name__)
+
+# Costs are USD per million tokens; override them in MODEL_TIERS to match current pricing.
+# local_latency/local_tail_rate shape the local stand-in backend.
+DEFAULT_TIERS = {
+    'fast': {
+        'model': 'models/gemini-2.0-flash-lite',
+        'timeout': 5.0,
+        'max_output_tokens': 160,
+        'input_cost': 0.075,
+        'output_cost': 0.30,
+        'local_latency': 0.15,
+        'local_tail_rate': 0.02
+    },
+    'full': {
+        'model': 'models/gemini-2.0-flash',
+        'timeout': 20.0,
+        'max_output_tokens': 1024,
+        'input_cost': 0.10,
+        'output_cost': 0.40,
+        'local_latency': 0.8,
+        'local_tail_rate': 0.05
+    }
+}
+
+# Most pool threads one request can tie up: a deal card's tip and intro run one after
+# the other but either may be left running after a timeout, and a hedged answer runs two attempts
+CALLS_PER_REQUEST = 2
+
+# Short, formulaic calls go to the fast tier; open-ended answers to the full one
+DEFAULT_SITE_TIERS = {
+    'tip': 'fast',
+    'intro': 'fast',
+    'clarification': 'fast',
+    'alternatives': 'full',
+    'fallback': 'full'
+}
+
+LOCAL_REPLIES = [
+    "Shopping smart is an art, and you're already halfway there! Tell me a store and I'll find you a deal. 🛍️",
+    "Great question! Stack a bank offer on top of a coupon and watch the price melt. 💸",
+    "Wishlists are free, impulse buys are not. Add it to cart, wait a day, then check the coupons! 😉",
+    "Sale seasons come around faster than you think, so keep an eye on Big Billion Days and Great Indian Festival. 🎉",
+    "Which store or category are you shopping for? I'll dig up the best coupon for it. 🔍"
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for cost tracking"""
+    return (len(text) + 3) // 4
+
+
+def parse_site_tiers(spec: str) -> Dict[str, str]:
+    """
+    Parse a call site to tier mapping such as "tip:fast,fallback:full"
+    Args:
+        spec: Comma-separated site:tier pairs
+    Returns:
+        Dict[str, str]: Tier name for each listed site
+    """
+    site_tiers = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        site, _, tier = item.partition(':')
+        site_tiers[site.strip()] = tier.strip()
+    return site_tiers
+
+
+class _LocalResponse:
+    """Mimics the parts of a Gemini response the chatbot reads"""
+
+    def __init__(self, text: str, chunks=None):
+        self.text = text
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks if self._chunks is not None else [self])
+
+
+class LocalModel:
+    """
+    Offline stand-in for a Gemini model with a configurable latency profile,
+    so the app can run and be load-tested without an API key. Replies are
+    canned and picked by prompt hash, so a prompt always gets the same one.
+    """
+
+    def __init__(self, model_name: str, latency: float, tail_rate: float = 0.02,
+                 tail_factor: float = 8.0, jitter: float = 0.3, max_output_tokens: Optional[int] = None):
+        """
+        Args:
+            model_name: Name reported in logs
+            latency: Typical seconds per call
+            tail_rate: Fraction of calls that take tail_factor times longer
+            tail_factor: How much slower a tail call is
+            jitter: Relative spread around the typical latency
+            max_output_tokens: Reply length cap
+        """
+        self.model_name = model_name
+        self.latency = latency
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self.jitter = jitter
+        self.max_output_tokens = max_output_tokens
+
+    def _reply(self, prompt: str) -> str:
+        index = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16) % len(LOCAL_REPLIES)
+        text = LOCAL_REPLIES[index]
+        if self.max_output_tokens:
+            text = text[:self.max_output_tokens * 4]
+        return text
+
+    def _duration(self) -> float:
+        duration = self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if random.random() < self.tail_rate:
+            duration *= self.tail_factor
+        return duration
+
+    def _stream(self, text: str, duration: float) -> Iterator[_LocalResponse]:
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            time.sleep(duration / len(words))
+            yield _LocalResponse(word if i == len(words) - 1 else word + ' ')
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs) -> _LocalResponse:
+        text = self._reply(prompt)
+        duration = self._duration()
+        if stream:
+            return _LocalResponse(text, self._stream(text, duration))
+        time.sleep(duration)
+        return _LocalResponse(text)
+
+    def start_chat(self, history=None) -> 'LocalModel':
+        return self
+
+    def send_message(self, content: str, stream: bool = False) -> _LocalResponse:
+        return _LocalResponse("")
+
+
+class ModelTier:
+    """A model with its own timeout, output cap and usage counters"""
+
+    def __init__(self, name: str, config: Dict, backend: str, window: int = 512):
+        self.name = name
+        self.model_name = config['model']
+        self.timeout = float(config['timeout'])
+        self.max_output_tokens = int(config['max_output_tokens'])
+        self.input_cost = float(config['input_cost'])
+        self.output_cost = float(config['output_cost'])
+        if backend == 'local':
+            self.model = LocalModel(self.model_name, float(config['local_latency']),
+                                    tail_rate=float(config['local_tail_rate']),
+                                    max_output_tokens=self.max_output_tokens)
+        else:
+            self.model = genai.GenerativeModel(
+                self.model_name, generation_config={'max_output_tokens': self.max_output_tokens})
+
+        self.latencies = deque(maxlen=window)
+        self.counts = {'calls': 0, 'errors': 0, 'timeouts': 0, 'cancelled': 0}
+        self.sites: Dict[str, int] = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_cost + output_tokens * self.output_cost) / 1_000_000
+
+
+class ModelRouter:
+    """
+    Sends each call site to a model tier. Every tier has its own model,
+    timeout and output-token cap, and tracks latency, estimated token use
+    and estimated cost.
+    """
+
+    def __init__(self, tiers: Optional[Dict[str, Dict]] = None, site_tiers: Optional[Dict[str, str]] = None,
+                 backend: str = 'gemini', default_tier: str = 'full', max_workers: int = 16):
+        """
+        Args:
+            tiers: Config for each tier, merged over DEFAULT_TIERS
+            site_tiers: Tier for each call site, merged over DEFAULT_SITE_TIERS
+            backend: "gemini" for the Gemini API, "local" for offline stand-in models
+            default_tier: Tier for call sites without a mapping
+            max_workers: Threads running model calls and stream reads; timed-out calls keep theirs until they finish
+        """
+        if backend not in ('gemini', 'local'):
+            raise ValueError(f"Unknown LLM backend: {backend}")
+        self.backend = backend
+
+        configs = {name: dict(config) for name, config in DEFAULT_TIERS.items()}
+        for name, config in (tiers or {}).items():
+            configs.setdefault(name, dict(DEFAULT_TIERS['full'])).update(config)
+        self.tiers = {name: ModelTier(name, config, backend) for name, config in configs.items()}
+
+        self.site_tiers = {**DEFAULT_SITE_TIERS, **(site_tiers or {})}
+        self.default_tier = default_tier
+        for tier in (*self.site_tiers.values(), default_tier):
+            if tier not in self.tiers:
+                raise ValueError(f"Unknown model tier: {tier}")
+
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jugaad-model')
+        self._in_flight = 0
+        self._abandoned = 0
+
+    @classmethod
+    def from_env(cls) -> 'ModelRouter':
+        """
+        Build a router from LLM_BACKEND, MODEL_TIERS (JSON, e.g.
+        {"fast": {"model": "models/gemini-2.0-flash", "timeout": 3}}) and
+        MODEL_SITE_TIERS (e.g. "alternatives:fast"). MODEL_MAX_WORKERS
+        defaults to twice the threads LLM_MAX_CONCURRENT requests can tie
+        up, leaving room for calls abandoned by earlier requests
+        """
+        default_workers = 2 * CALLS_PER_REQUEST * int(os.getenv('LLM_MAX_CONCURRENT', '4'))
+        return cls(
+            tiers=json.loads(os.getenv('MODEL_TIERS', '{}')),
+            site_tiers=parse_site_tiers(os.getenv('MODEL_SITE_TIERS', '')),
+            backend=os.getenv('LLM_BACKEND', 'gemini'),
+            max_workers=int(os.getenv('MODEL_MAX_WORKERS', str(default_workers)))
+        )
+
+    def tier_for(self, site: str) -> ModelTier:
+        """The tier serving a call site"""
+        return self.tiers[self.site_tiers.get(site, self.default_tier)]
+
+    def _record(self, tier: ModelTier, site: str, prompt: str, text: Optional[str], elapsed: float,
+                outcome: Optional[str] = None) -> None:
+        with self._lock:
+            tier.counts['calls'] += 1
+            tier.sites[site] = tier.sites.get(site, 0) + 1
+            tier.input_tokens += estimate_tokens(prompt)
+            if outcome is not None:
+                tier.counts[outcome] += 1
+                return
+            tier.output_tokens += estimate_tokens(text)
+            tier.latencies.append(elapsed)
+
+    def generate(self, site: str, prompt: str) -> str:
+        """
+        Run a call on its site's tier
+        Args:
+            site: The call site name
+            prompt: The prompt to send
+        Returns:
+            str: The stripped response text
+        Raises:
+            TimeoutError: The tier's timeout passed first; the call is abandoned, not stopped
+        """
+        tier = self.tier_for(site)
+        start = time.monotonic()
+        try:
+            text = self._run(lambda: tier.model.generate_content(prompt).text.strip(), tier.timeout)
+        except FutureTimeoutError:
+            self._record(tier, site, prompt, None, time.monotonic() - start, 'timeouts')
+            raise TimeoutError(f"{tier.name} tier call for {site} took longer than {tier.timeout}s")
+        except Exception:
+            self._record(tier, site, prompt, None, time.monotonic() - start, 'errors')
+            raise
+        self._record(tier, site, prompt, text, time.monotonic() - start)
+        return text
+
+    def _run(self, fn, timeout: float):
+        """
+        Run fn on the worker pool and wait up to timeout seconds for it
+        Raises:
+            concurrent.futures.TimeoutError: The timeout passed first; fn is abandoned, not stopped
+        """
+        with self._lock:
+            self._in_flight += 1
+        future = self._pool.submit(fn)
+        future.add_done_callback(self._call_done)
+        try:
+            return future.result(timeout=max(timeout, 0))
+        except FutureTimeoutError:
+            # A call still queued for a thread never starts; a running one holds its thread until it returns
+            if not future.cancel():
+                with self._lock:
+                    self._abandoned += 1
+                future.add_done_callback(self._abandoned_done)
+            raise
+
+    def _call_done(self, future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _abandoned_done(self, future) -> None:
+        with self._lock:
+            self._abandoned -= 1
+
+    def stream(self, site: str, prompt: str, cancelled: threading.Event) -> Iterator[str]:
+        """
+        Stream a call on its site's tier chunk by chunk. Each chunk is read
+        on the worker pool, so a stalled stream times out like generate()
+        Args:
+            site: The call site name
+            prompt: The prompt to send
+            cancelled: Set to stop reading the stream early
+        Yields:
+            str: Response text chunks
+        Raises:
+            TimeoutError: The tier's timeout passed before the stream ended; the read is abandoned
+        """
+        tier = self.tier_for(site)
+        start = time.monotonic()
+        deadline = start + tier.timeout
+        chunks = []
+        try:
+            # The first chunk arrives with generate_content's return, later ones from next()
+            response = self._run(lambda: iter(tier.model.generate_content(prompt, stream=True)), tier.timeout)
+            while True:
+                chunk = self._run(lambda: next(response, None), deadline - time.monotonic())
+                if chunk is None:
+                    break
+                if cancelled.is_set():
+                    logger.info(f"Cancelled streaming {site} response")
+                    self._record(tier, site, prompt, None, time.monotonic() - start, 'cancelled')
+                    return
+                chunks.append(chunk.text)
+                yield chunk.text
+        except FutureTimeoutError:
+            self._record(tier, site, prompt, None, time.monotonic() - start, 'timeouts')
+            raise TimeoutError(f"{tier.name} tier stream for {site} took longer than {tier.timeout}s")
+        except Exception:
+            self._record(tier, site, prompt, None, time.monotonic() - start, 'errors')
+            raise
+        self._record(tier, site, prompt, ''.join(chunks), time.monotonic() - start)
+
+    def start_chat(self, site: str = 'fallback'):
+        """Start a chat session on the tier serving a call site"""
+        return self.tier_for(site).model.start_chat(history=[])
+
+    def stats(self) -> Dict:
+        """Return per-tier latency percentiles, call counts, estimated tokens and estimated cost"""
+        with self._lock:
+            tiers = {}
+            for name, tier in self.tiers.items():
+                latencies = [s * 1000 for s in tier.latencies]
+                tiers[name] = {
+                    'model': tier.model_name,
+                    'timeout': tier.timeout,
+                    'max_output_tokens': tier.max_output_tokens,
+                    'latency_ms': {p: round(percentile(latencies, q), 3) for p, q in (('p50', 50), ('p95', 95), ('p99', 99))},
+                    **tier.counts,
+                    'sites': dict(tier.sites),
+                    'input_tokens_est': tier.input_tokens,
+                    'output_tokens_est': tier.output_tokens,
+                    'cost_usd_est': round(tier.cost(tier.input_tokens, tier.output_tokens), 6)
+                }
+            return {
+                'backend': self.backend,
+                'site_tiers': dict(self.site_tiers),
+                # Calls and stream reads on the worker pool; abandoned ones timed out but are still running
+                'pool': {'max_workers': self.max_workers, 'in_flight': self._in_flight, 'abandoned': self._abandoned},
+                'tiers': tiers
+            }
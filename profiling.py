@@ -0,0 +1,352 @@
+import os
+import sys
+import time
+import hmac
+import heapq
+import random
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Header an admin sends (with the admin token as its value) to profile one request
+PROFILE_HEADER = 'X-Jugaad-Profile'
+# Optional header selecting the profiler: "trace" (deterministic) or "sample" (statistical)
+PROFILE_MODE_HEADER = 'X-Jugaad-Profile-Mode'
+
+_local = threading.local()
+
+
+class Span:
+    """A timed phase inside a request trace"""
+
+    def __init__(self, trace: 'RequestTrace', name: str, depth: int):
+        self.trace = trace
+        self.name = name
+        self.depth = depth
+        self.start = time.perf_counter()
+        self.end_time = None
+
+    def end(self) -> None:
+        """Close the span; calling it more than once is harmless"""
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+            self.trace._close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end()
+        return False
+
+    def to_dict(self) -> Dict:
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'offset_ms': round((self.start - self.trace.start) * 1000, 3),
+            'duration_ms': round((end_time - self.start) * 1000, 3)
+        }
+
+
+class _NullSpan:
+    """Span returned when no request is being traced"""
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class RequestTrace:
+    """Spans and timing collected for a single request"""
+
+    def __init__(self, path: str, mode: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:16]
+        self.path = path
+        self.mode = mode
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans: List[Span] = []
+        self.profile_file = None
+        self._open: List[Span] = []
+
+    def start_span(self, name: str) -> Span:
+        span = Span(self, name, len(self._open))
+        self.spans.append(span)
+        self._open.append(span)
+        return span
+
+    def _close(self, span: Span) -> None:
+        if span in self._open:
+            self._open.remove(span)
+
+    def finish(self) -> None:
+        """Close any spans left open by an early return and stop the clock"""
+        for span in list(self._open):
+            span.end()
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'path': self.path,
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+            'profile_file': self.profile_file,
+            'spans': [span.to_dict() for span in self.spans]
+        }
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Return the trace of the request running on this thread, if any"""
+    return getattr(_local, 'trace', None)
+
+
+def start_span(name: str):
+    """
+    Open a span on the current request trace
+    Args:
+        name: The phase name
+    Returns:
+        Span: A span to end() explicitly, or a no-op span when not tracing
+    """
+    trace = current_trace()
+    if trace is None:
+        return _NULL_SPAN
+    return trace.start_span(name)
+
+
+def span(name: str):
+    """Context-manager form of start_span()"""
+    return start_span(name)
+
+
+def _frame_label(code) -> str:
+    label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label.replace(';', ',')
+
+
+class _DeterministicProfiler:
+    """Records exact wall time per call stack via sys.setprofile"""
+
+    def __init__(self):
+        self.stacks: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._stack: List[str] = []
+        self._last = None
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._stack:
+            self.stacks[tuple(self._stack)] += now - self._last
+        if event == 'call':
+            self._stack.append(_frame_label(frame.f_code))
+        elif event == 'c_call':
+            name = getattr(arg, '__qualname__', None) or getattr(arg, '__name__', repr(arg))
+            self._stack.append(f"{name} (builtin)".replace(';', ','))
+        elif event in ('return', 'c_return', 'c_exception'):
+            if self._stack:
+                self._stack.pop()
+        self._last = time.perf_counter()
+
+    def start(self) -> None:
+        self._last = time.perf_counter()
+        sys.setprofile(self._callback)
+
+    def stop(self) -> None:
+        sys.setprofile(None)
+
+    def folded(self) -> List[str]:
+        # Values are microseconds of wall time spent with exactly this stack on top
+        return [f"{';'.join(stack)} {int(seconds * 1_000_000)}"
+                for stack, seconds in self.stacks.items() if seconds * 1_000_000 >= 1]
+
+
+class _SamplingProfiler:
+    """Samples the request thread's stack from a background thread"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self._target = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='jugaad-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def folded(self) -> List[str]:
+        # Values are sample counts
+        return [f"{';'.join(stack)} {count}" for stack, count in self.stacks.items()]
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile, writes their profiles as collapsed
+    stacks (flamegraph.pl / speedscope input) and keeps the slowest recent
+    request traces in memory
+    """
+
+    def __init__(self, admin_token: str = None, sample_rate: float = 0.0,
+                 profile_dir: str = 'profiles', ring_size: int = 20,
+                 ring_window: float = 3600, sample_interval: float = 0.005, max_files: int = 200):
+        """
+        Args:
+            admin_token: Token an admin sends in the profile header; None disables it
+            sample_rate: Fraction of requests profiled with the sampling profiler
+            profile_dir: Directory the .folded profiles are written to
+            ring_size: Number of slow traces to keep
+            ring_window: Seconds a trace stays eligible for the slow ring
+            sample_interval: Seconds between stack samples
+            max_files: Newest .folded profiles kept in profile_dir; older ones are deleted
+        """
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+        self.ring_size = ring_size
+        self.ring_window = ring_window
+        self.sample_interval = sample_interval
+        self.max_files = max_files
+        self._slowest: List[Tuple[float, int, Dict]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'RequestProfiler':
+        """Build a profiler from the PROFILE_* and ADMIN_TOKEN environment variables"""
+        return cls(
+            admin_token=os.getenv('ADMIN_TOKEN') or None,
+            sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+            profile_dir=os.getenv('PROFILE_DIR', 'profiles'),
+            ring_size=int(os.getenv('PROFILE_RING_SIZE', '20')),
+            ring_window=float(os.getenv('PROFILE_RING_WINDOW', '3600')),
+            sample_interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005')),
+            max_files=int(os.getenv('PROFILE_MAX_FILES', '200'))
+        )
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        """Check a token against the configured admin token"""
+        if not self.admin_token or not token:
+            return False
+        return hmac.compare_digest(token, self.admin_token)
+
+    def _select_mode(self, profile_token: Optional[str], requested_mode: Optional[str]) -> Optional[str]:
+        if self.is_admin(profile_token):
+            return 'sample' if requested_mode == 'sample' else 'trace'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    @contextmanager
+    def trace_request(self, path: str, profile_token: str = None, requested_mode: str = None):
+        """
+        Trace one request on the current thread
+        Args:
+            path: The request path
+            profile_token: Value of the profile header, if sent
+            requested_mode: Value of the profile mode header, if sent
+        Yields:
+            RequestTrace: The trace being collected
+        """
+        mode = self._select_mode(profile_token, requested_mode)
+        trace = RequestTrace(path, mode)
+        profiler = None
+        if mode == 'trace':
+            profiler = _DeterministicProfiler()
+        elif mode == 'sample':
+            profiler = _SamplingProfiler(self.sample_interval)
+
+        _local.trace = trace
+        if profiler:
+            profiler.start()
+        try:
+            yield trace
+        finally:
+            if profiler:
+                profiler.stop()
+            trace.finish()
+            _local.trace = None
+            if profiler:
+                self._dump(trace, profiler)
+            self._record(trace)
+
+    def _dump(self, trace: RequestTrace, profiler) -> None:
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{trace.id}.{trace.mode}.folded")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(profiler.folded()) + '\n')
+            trace.profile_file = os.path.basename(path)
+            logger.info(f"Wrote {trace.mode} profile for {trace.path} to {path}")
+        except OSError as e:
+            logger.error(f"Error writing profile: {str(e)}")
+            return
+        self._prune_files()
+
+    def _prune_files(self) -> None:
+        # Other workers write to the same directory, so files may vanish under us
+        paths = []
+        for name in os.listdir(self.profile_dir):
+            if name.endswith('.folded'):
+                path = os.path.join(self.profile_dir, name)
+                try:
+                    paths.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        paths.sort(reverse=True)
+        for _, path in paths[self.max_files:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _record(self, trace: RequestTrace) -> None:
+        with self._lock:
+            self._prune()
+            self._seq += 1
+            entry = (trace.duration, self._seq, trace.to_dict())
+            if len(self._slowest) < self.ring_size:
+                heapq.heappush(self._slowest, entry)
+            elif entry[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ring_window
+        kept = [entry for entry in self._slowest if entry[2]['started_at'] >= cutoff]
+        if len(kept) != len(self._slowest):
+            heapq.heapify(kept)
+            self._slowest = kept
+
+    def slowest(self) -> List[Dict]:
+        """Return the slowest recent traces, slowest first"""
+        with self._lock:
+            self._prune()
+            return [entry[2] for entry in sorted(self._slowest, reverse=True)]
@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime 2^31 - 1; keeps a * hash + b inside uint64 for 32-bit hashes
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def normalize_message(message: str) -> str:
+    """
+    Reduce a message to the form used as a cache key
+    Args:
+        message: The user's input message
+    Returns:
+        str: Lowercased text without apostrophes or punctuation, single-spaced
+    """
+    text = message.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class _Entry:
+    """A cached response and its MinHash signature"""
+
+    def __init__(self, response: str, signature: np.ndarray):
+        self.response = response
+        self.signature = signature
+        self.created = time.monotonic()
+        self.hits = 0
+
+
+class ResponseCache:
+    """
+    LRU response cache keyed on normalized messages, with a MinHash/LSH
+    index over character shingles so near-duplicate messages hit too
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, threshold: float = 0.85,
+                 num_perm: int = 128, bands: int = 32, shingle_size: int = 3, seed: int = 1):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted; 0 disables the cache
+            ttl: Seconds an entry stays valid
+            threshold: Estimated Jaccard similarity a near-duplicate needs to hit
+            num_perm: MinHash signature length
+            bands: LSH bands; num_perm must divide evenly into them
+            shingle_size: Characters per shingle
+            seed: Seed for the MinHash permutations
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._counts = {'exact_hits': 0, 'near_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCache':
+        """Build a cache from the RESPONSE_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '1024')),
+            ttl=float(os.getenv('RESPONSE_CACHE_TTL', '3600')),
+            threshold=float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.85'))
+        )
+
+    def _signature(self, key: str) -> np.ndarray:
+        k = self.shingle_size
+        shingles = {key[i:i + k] for i in range(max(1, len(key) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for band, band_key in zip(self._buckets, self._band_keys(entry.signature)):
+            bucket = band.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del band[band_key]
+
+    def _fresh(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.created > self.ttl:
+            self._remove(key)
+            self._counts['expirations'] += 1
+            return None
+        return entry
+
+    def get(self, message: str) -> Optional[str]:
+        """
+        Look up a response for a message or a near-duplicate of it
+        Args:
+            message: The user's input message
+        Returns:
+            Optional[str]: The cached response, or None on a miss
+        """
+        if self.max_entries <= 0:
+            return None
+        key = normalize_message(message)
+        signature = self._signature(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._fresh(key, now)
+            if entry is not None:
+                self._counts['exact_hits'] += 1
+            else:
+                candidates = set()
+                for band, band_key in zip(self._buckets, self._band_keys(signature)):
+                    candidates.update(band.get(band_key, ()))
+                best_score = self.threshold
+                for candidate in candidates:
+                    candidate_entry = self._fresh(candidate, now)
+                    if candidate_entry is None:
+                        continue
+                    score = float(np.mean(candidate_entry.signature == signature))
+                    if score >= best_score:
+                        best_score, key, entry = score, candidate, candidate_entry
+                if entry is None:
+                    self._counts['misses'] += 1
+                    return None
+                self._counts['near_hits'] += 1
+            entry.hits += 1
+            self._entries.move_to_end(key)
+            return entry.response
+
+    def put(self, message: str, response: str) -> None:
+        """
+        Cache a response for a message
+        Args:
+            message: The user's input message
+            response: The response to reuse
+        """
+        if self.max_entries <= 0:
+            return
+        key = normalize_message(message)
+        signature = self._signature(key)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(response, signature)
+            for band, band_key in zip(self._buckets, self._band_keys(signature)):
+                band.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counts['evictions'] += 1
+
+    def stats(self, top: int = 10) -> Dict:
+        """Return hit/miss counts and the most-hit entries"""
+        with self._lock:
+            hottest = sorted(self._entries.items(), key=lambda item: item[1].hits, reverse=True)[:top]
+            lookups = self._counts['exact_hits'] + self._counts['near_hits'] + self._counts['misses']
+            hits = self._counts['exact_hits'] + self._counts['near_hits']
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'threshold': self.threshold,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'top_entries': [{'key': key, 'hits': entry.hits} for key, entry in hottest],
+                **self._counts
+            }
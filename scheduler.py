@@ -0,0 +1,169 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of a list of numbers
+    Args:
+        values: The samples
+        pct: The percentile, between 0 and 100
+    Returns:
+        float: The percentile value, or 0 for no samples
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class _Waiter:
+    """A queued request waiting for an LLM slot"""
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """
+    Caps concurrent LLM-bound work and queues the rest by priority.
+    Requests that can't get a slot before their queue deadline, or that
+    arrive when the queue is full, are shed so the caller can answer
+    with a degraded canned response instead
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 32,
+                 queue_timeout: float = 5.0, history: int = 512):
+        """
+        Args:
+            max_concurrent: LLM-bound requests allowed to run at once
+            max_queue: Requests allowed to wait for a slot
+            queue_timeout: Seconds a request may wait before it is shed
+            history: Number of recent queue waits kept for the stats
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._queue: List[_Waiter] = []
+        self._seq = 0
+        self._waits = deque(maxlen=history)
+        self._counts = {'fast_path': 0, 'admitted': 0, 'shed_queue_full': 0, 'shed_deadline': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        """Build a controller from the LLM_* environment variables"""
+        return cls(
+            max_concurrent=int(os.getenv('LLM_MAX_CONCURRENT', '4')),
+            max_queue=int(os.getenv('LLM_MAX_QUEUE', '32')),
+            queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '5'))
+        )
+
+    def record_fast_path(self) -> None:
+        """Count a request that was served without an LLM slot"""
+        with self._lock:
+            self._counts['fast_path'] += 1
+
+    def acquire(self, priority: int = 0) -> bool:
+        """
+        Wait for an LLM slot
+        Args:
+            priority: Lower values are served first
+        Returns:
+            bool: True if a slot was granted, False if the request was shed
+        """
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queue:
+                self._active += 1
+                self._counts['admitted'] += 1
+                self._waits.append(0.0)
+                return True
+            if len(self._queue) >= self.max_queue:
+                self._counts['shed_queue_full'] += 1
+                logger.warning(f"LLM queue full ({self.max_queue}), shedding request")
+                return False
+            self._seq += 1
+            waiter = _Waiter(priority, self._seq)
+            heapq.heappush(self._queue, waiter)
+
+        waiter.event.wait(self.queue_timeout)
+
+        with self._lock:
+            waited = time.monotonic() - waiter.enqueued
+            self._waits.append(waited)
+            if waiter.granted:
+                self._counts['admitted'] += 1
+                return True
+            self._queue.remove(waiter)
+            heapq.heapify(self._queue)
+            self._counts['shed_deadline'] += 1
+            logger.warning(f"LLM queue deadline of {self.queue_timeout}s passed, shedding request")
+            return False
+
+    def release(self) -> None:
+        """Return a slot, handing it straight to the best queued request"""
+        with self._lock:
+            if self._queue:
+                waiter = heapq.heappop(self._queue)
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self._active -= 1
+
+    @contextmanager
+    def slot(self, priority: int = 0):
+        """
+        Hold an LLM slot for the duration of a block
+        Args:
+            priority: Lower values are served first
+        Yields:
+            bool: Whether the slot was granted
+        """
+        with profiling.span('admission'):
+            admitted = self.acquire(priority)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+    def stats(self) -> Dict:
+        """Return queue depth, wait times and admission counts"""
+        with self._lock:
+            waits = [w * 1000 for w in self._waits]
+            depth_by_priority: Dict[int, int] = {}
+            for waiter in self._queue:
+                depth_by_priority[waiter.priority] = depth_by_priority.get(waiter.priority, 0) + 1
+            return {
+                'active': self._active,
+                'max_concurrent': self.max_concurrent,
+                'queue_depth': len(self._queue),
+                'queue_depth_by_priority': depth_by_priority,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'wait_ms': {
+                    'p50': round(percentile(waits, 50), 3),
+                    'p95': round(percentile(waits, 95), 3),
+                    'max': round(max(waits), 3) if waits else 0.0
+                },
+                **self._counts
+            }
@@ -0,0 +1,123 @@
+// Answers canned intents (greetings, thanks, yes/no, ...) in the browser
+// using the intent bundle served by /api/intents, and remembers server
+// answers for the rest of the session. Matching mirrors classify() in
+// coupon_chatbot.py; anything not matched here goes to the server.
+window.JugaadFastPath = (function() {
+    const CACHE_KEY = 'jugaad-response-cache';
+    const CACHE_SIZE = 50;
+
+    let bundle = null;
+    let responseCache = loadCache();
+
+    function load(url) {
+        if (!url) return Promise.resolve(null);
+
+        return fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                // Python's \w matches any letter or digit; JavaScript's only ASCII ones
+                data.intents.forEach(intent => {
+                    if (intent.match === 'regex') {
+                        intent.regexes = intent.patterns.map(pattern =>
+                            new RegExp(pattern.replace(/\\w/g, '[\\p{L}\\p{N}_]'), 'u'));
+                    }
+                });
+                bundle = data;
+                return data;
+            })
+            .catch(error => {
+                console.error('Error loading intent bundle:', error);
+                return null;
+            });
+    }
+
+    function capitalize(text) {
+        return text.charAt(0).toUpperCase() + text.slice(1).toLowerCase();
+    }
+
+    function matchIntent(intent, lower) {
+        const patterns = intent.patterns;
+
+        switch (intent.match) {
+            case 'word_prefix':
+                return patterns.includes(lower.trim()) || patterns.some(p => lower.startsWith(p + ' ')) ? {} : null;
+            case 'contains':
+                return patterns.some(p => lower.includes(p)) ? {} : null;
+            case 'contains_short':
+                return patterns.some(p => lower.includes(p)) && lower.split(/\s+/).filter(Boolean).length < 5 ? {} : null;
+            case 'exact':
+                return patterns.includes(lower) ? {} : null;
+            case 'regex':
+                for (const regex of intent.regexes) {
+                    const found = regex.exec(lower);
+                    if (found) return { name: capitalize(found[1]) };
+                }
+                return null;
+            default:
+                return null;
+        }
+    }
+
+    function reply(message) {
+        if (!bundle) return null;
+
+        const lower = message.toLowerCase();
+        for (const intent of bundle.intents) {
+            const match = matchIntent(intent, lower);
+            if (!match) continue;
+
+            const template = intent.responses[Math.floor(Math.random() * intent.responses.length)];
+            let text = template.replace(/\{message\}/g, capitalize(message)).replace(/\{name\}/g, match.name || '');
+            if (Math.random() < intent.tagline_rate) {
+                text += bundle.tagline;
+            }
+            return text;
+        }
+        return null;
+    }
+
+    function normalize(message) {
+        return message.toLowerCase().replace(/['’]/g, '').replace(/[^\p{L}\p{N}_\s]/gu, ' ').split(/\s+/).filter(Boolean).join(' ');
+    }
+
+    function loadCache() {
+        try {
+            return new Map(JSON.parse(sessionStorage.getItem(CACHE_KEY) || '[]'));
+        } catch (e) {
+            return new Map();
+        }
+    }
+
+    function saveCache() {
+        try {
+            sessionStorage.setItem(CACHE_KEY, JSON.stringify(Array.from(responseCache.entries())));
+        } catch (e) {
+            // Storage full or unavailable; the in-memory cache still works
+        }
+    }
+
+    function getCached(message) {
+        const key = normalize(message);
+        if (!responseCache.has(key)) return null;
+
+        // Move to the end so the least recently used entry is evicted first
+        const response = responseCache.get(key);
+        responseCache.delete(key);
+        responseCache.set(key, response);
+        return response;
+    }
+
+    // Only for answers the server marked cacheable; stand-ins, errors and
+    // deal cards never are
+    function remember(message, response) {
+        const key = normalize(message);
+        responseCache.delete(key);
+        responseCache.set(key, response);
+        while (responseCache.size > CACHE_SIZE) {
+            responseCache.delete(responseCache.keys().next().value);
+        }
+        saveCache();
+    }
+
+    return { load, reply, getCached, remember };
+})();
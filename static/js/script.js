@@ -6,12 +6,44 @@ document.addEventListener('DOMContentLoaded', function() {
     const sendButton = document.getElementById('send-button');
     const suggestionChips = document.querySelectorAll('.chip');
 
+    // Empty means same origin as the page
+    const API_BASE = window.JUGAAD_API_BASE || '';
+
+    // Answers canned intents locally and caches server answers for the session
+    const fastPath = window.JugaadFastPath;
+
+    // Identifies this chat so every turn reaches the node holding its state
+    const sessionId = loadSessionId();
+
+    // Close codes the server sends: back off when it's full, wait for the
+    // next message when the tab has gone idle
+    const SOCKET_CLOSE_AT_CAPACITY = 1013;
+    const SOCKET_CLOSE_IDLE = 4000;
+
     // Variables
-    let isProcessing = false;
+    let socket = null;
+    let socketReady = false;
+    let reconnectDelay = 1000;
+    // Closed for idleness; reopened when the user sends something
+    let socketIdle = false;
+    // Set when a node sends us to the node owning this session
+    let socketRedirect = null;
+    let followedRedirect = false;
+    let nextRequestId = 1;
+    // The message awaiting an answer over the socket: { id, message, contentElement, text }
+    let activeRequest = null;
+    // Aborts the in-flight HTTP request, if any
+    let httpController = null;
 
     // Initialize the chat with a greeting
     fetchGreeting();
 
+    // Load the canned intents the browser can answer without the server
+    fastPath.load(document.body.dataset.intentsUrl);
+
+    // Open the persistent chat connection; HTTP is used until it's ready
+    connectSocket();
+
     // Event Listeners
     chatForm.addEventListener('submit', handleSubmit);
     userInput.addEventListener('keypress', function(e) {
@@ -31,10 +63,29 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // Functions
+    function loadSessionId() {
+        const key = 'jugaad-session-id';
+        let id = null;
+        try {
+            id = sessionStorage.getItem(key);
+        } catch (e) {
+            // Storage unavailable; the id lasts until the page reloads
+        }
+        if (!id) {
+            id = window.crypto && crypto.randomUUID
+                ? crypto.randomUUID()
+                : Date.now().toString(36) + Math.random().toString(36).slice(2);
+            try {
+                sessionStorage.setItem(key, id);
+            } catch (e) {}
+        }
+        return id;
+    }
+
     function fetchGreeting() {
         showTypingIndicator();
         
-        fetch('https://web-production-a76fe.up.railway.app/api/greeting')
+        fetch(`${API_BASE}/api/greeting`)
             .then(response => response.json())
             .then(data => {
                 removeTypingIndicator();
@@ -51,11 +102,128 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    function connectSocket() {
+        if (!('WebSocket' in window)) return;
+        
+        const base = API_BASE || window.location.origin;
+        const url = socketRedirect || base.replace(/^http/, 'ws') + '/ws/chat?session=' + encodeURIComponent(sessionId);
+        followedRedirect = socketRedirect !== null;
+        socketRedirect = null;
+        socketIdle = false;
+        socket = new WebSocket(url);
+        
+        // The backoff is only reset once an answer comes back, since a
+        // server at capacity accepts the handshake and then closes
+        socket.addEventListener('open', function() {
+            socketReady = true;
+        });
+        
+        socket.addEventListener('message', function(event) {
+            handleSocketMessage(JSON.parse(event.data));
+        });
+        
+        socket.addEventListener('close', function(event) {
+            socketReady = false;
+            
+            // Finish an interrupted answer over HTTP
+            if (activeRequest) {
+                const pending = activeRequest;
+                activeRequest = null;
+                if (pending.contentElement) {
+                    pending.contentElement.parentElement.remove();
+                }
+                sendOverHttp(pending.message);
+            }
+            
+            if (socketRedirect) {
+                connectSocket();
+                return;
+            }
+            if (event.code === SOCKET_CLOSE_IDLE) {
+                socketIdle = true;
+                return;
+            }
+            if (event.code === SOCKET_CLOSE_AT_CAPACITY) {
+                console.warn('Chat server is at capacity; using HTTP for now');
+            }
+            setTimeout(connectSocket, reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        });
+    }
+
+    function handleSocketMessage(data) {
+        if (data.type === 'ping') {
+            socket.send(JSON.stringify({ type: 'pong' }));
+            return;
+        }
+        
+        // Another node owns this session; reconnect there, but don't bounce
+        // between nodes that disagree about membership
+        if (data.type === 'redirect') {
+            if (!followedRedirect) {
+                socketRedirect = data.url;
+            }
+            return;
+        }
+        
+        // Ignore anything for a message that has been superseded
+        if (!activeRequest || data.id !== activeRequest.id) return;
+        
+        if (data.type === 'chunk') {
+            if (!activeRequest.contentElement) {
+                removeTypingIndicator();
+                activeRequest.contentElement = createBotMessage();
+                activeRequest.contentElement.appendChild(document.createElement('p'));
+            }
+            activeRequest.text += data.text;
+            activeRequest.contentElement.firstChild.textContent = activeRequest.text;
+            scrollToBottom();
+        } else if (data.type === 'done') {
+            reconnectDelay = 1000;
+            removeTypingIndicator();
+            const contentElement = activeRequest.contentElement || createBotMessage();
+            if (data.response) {
+                renderBotContent(contentElement, data.response);
+                if (data.cacheable) {
+                    fastPath.remember(activeRequest.message, data.response);
+                }
+            } else {
+                renderBotContent(contentElement, "I'm sorry, I couldn't process your request. Please try again.");
+            }
+            scrollToBottom();
+            activeRequest = null;
+        } else if (data.type === 'error') {
+            removeTypingIndicator();
+            if (activeRequest.contentElement) {
+                activeRequest.contentElement.parentElement.remove();
+            }
+            addBotMessage("I'm sorry, there was an error processing your request. Please try again.");
+            activeRequest = null;
+        }
+    }
+
+    function cancelInFlight() {
+        if (httpController) {
+            httpController.abort();
+            httpController = null;
+        }
+        if (activeRequest) {
+            if (socketReady) {
+                socket.send(JSON.stringify({ type: 'cancel', id: activeRequest.id }));
+            }
+            activeRequest = null;
+        }
+        removeTypingIndicator();
+    }
+
     function handleSubmit(e) {
         e.preventDefault();
         
         const message = userInput.value.trim();
-        if (!message || isProcessing) return;
+        if (!message) return;
+        
+        // A new message supersedes whatever is still being answered
+        cancelInFlight();
         
         // Add user message to chat
         addUserMessage(message);
@@ -63,35 +231,71 @@ document.addEventListener('DOMContentLoaded', function() {
         // Clear input
         userInput.value = '';
         
+        // Canned intents and repeated questions never need the server
+        const localResponse = fastPath.reply(message) || fastPath.getCached(message);
+        if (localResponse) {
+            addBotMessage(localResponse);
+            return;
+        }
+        
+        if (socketReady) {
+            sendOverSocket(message);
+        } else {
+            sendOverHttp(message);
+            // An idle tab's socket is reopened for the messages after this one
+            if (socketIdle) {
+                connectSocket();
+            }
+        }
+    }
+
+    function sendOverSocket(message) {
+        showTypingIndicator();
+        
+        activeRequest = { id: nextRequestId++, message, contentElement: null, text: '' };
+        socket.send(JSON.stringify({ type: 'message', id: activeRequest.id, message }));
+    }
+
+    function sendOverHttp(message) {
         // Show typing indicator
         showTypingIndicator();
         
-        // Set processing flag
-        isProcessing = true;
+        const controller = new AbortController();
+        httpController = controller;
         
         // Send message to server
-        fetch('https://web-production-a76fe.up.railway.app/api/chat', {
+        fetch(`${API_BASE}/api/chat`, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'X-Session-Id': sessionId
             },
-            body: JSON.stringify({ message })
+            body: JSON.stringify({ message }),
+            signal: controller.signal
         })
         .then(response => response.json())
         .then(data => {
+            // Superseded by a newer message
+            if (controller !== httpController) return;
+            httpController = null;
+            
             removeTypingIndicator();
             if (data.response) {
                 addBotMessage(data.response);
+                if (data.cacheable) {
+                    fastPath.remember(message, data.response);
+                }
             } else {
                 addBotMessage("I'm sorry, I couldn't process your request. Please try again.");
             }
-            isProcessing = false;
         })
         .catch(error => {
+            if (error.name === 'AbortError' || controller !== httpController) return;
+            httpController = null;
+            
             console.error('Error sending message:', error);
             removeTypingIndicator();
             addBotMessage("I'm sorry, there was an error processing your request. Please try again.");
-            isProcessing = false;
         });
     }
 
@@ -113,12 +317,25 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function addBotMessage(message) {
+        renderBotContent(createBotMessage(), message);
+        scrollToBottom();
+    }
+
+    function createBotMessage() {
         const messageElement = document.createElement('div');
         messageElement.classList.add('message', 'bot-message');
         
         const contentElement = document.createElement('div');
         contentElement.classList.add('message-content');
         
+        messageElement.appendChild(contentElement);
+        chatMessages.appendChild(messageElement);
+        return contentElement;
+    }
+
+    function renderBotContent(contentElement, message) {
+        contentElement.innerHTML = '';
+        
         // Check if the message contains coupon information
         if (message.includes('🏷️ CODE:') || message.includes('💰 DISCOUNT:')) {
             // Format coupon message
@@ -129,10 +346,6 @@ document.addEventListener('DOMContentLoaded', function() {
             paragraphElement.textContent = message;
             contentElement.appendChild(paragraphElement);
         }
-        
-        messageElement.appendChild(contentElement);
-        chatMessages.appendChild(messageElement);
-        scrollToBottom();
     }
 
     function formatCouponMessage(message) {